@@ -20,6 +20,7 @@ import pandas as pd
 from datetime import timedelta
 
 # local source
+import py_to_cassandra as ptc
 from utils import (
     get_last_registered_config,
     get_home_power_data_from_cassandra
@@ -106,7 +107,7 @@ def get_homes_with_missing_data(config, yesterday):
     """
 
     to_alert = {}
-    for home_id in config.get_ids().keys():
+    for home_id in config.get_home_ids():
         nb_zeros, tot_len = check_missing(home_id, yesterday)
 
         percentage = 0
@@ -124,7 +125,7 @@ def get_homes_with_incorrect_signs(config, yesterday):
     If some signs are incorrect, we send an alert by email
     """
     to_alert = {}
-    for home_id in config.get_ids().keys():
+    for home_id in config.get_home_ids():
         ok, info = check_signs(home_id, yesterday)
         if not ok:
             to_alert[home_id] = info
@@ -178,39 +179,40 @@ def main():
     args = argparser.parse_args()
     mode = args.mode
 
-    last_config = get_last_registered_config()
-    if last_config:
-        now = pd.Timestamp.now(tz="CET")
-        yesterday = get_yesterday(now)
-        print("yesterday : ", yesterday)
-
-        if mode == "missing":
-            to_alert = get_homes_with_missing_data(last_config, yesterday)
-            if len(to_alert) > 0:
-                threshold = "{} %".format(MISSING_ALERT_THRESHOLD)
-                legend = "'home id' > percentage of missing data for 1 day"
-                mail_content = get_mail_text(
-                    "There is missing data",
-                    threshold, legend, to_alert, yesterday)
-                print(mail_content)
-                write_mail_to_file(mail_content, "alert_missing.txt")
-                send_mail("alert_missing.txt")
-
-        elif mode == "sign":
-            to_alert = get_homes_with_incorrect_signs(last_config, yesterday)
-            if len(to_alert) > 0:
-                threshold = "{} ".format(SIGN_THRESHOLD)
-                legend = "'home id ' > \n"
-                legend += "{'cons_neg = is there any negative consumption values ?', \n"
-                legend += "'prod_pos = is there any positive production values ?'}}"
-                mail_content = get_mail_text(
-                    "There are incorrect signs",
-                    threshold, legend, to_alert, yesterday)
-                print(mail_content)
-                write_mail_to_file(mail_content, "alert_signs.txt")
-                send_mail("alert_signs.txt")
-
-    print("No registered config in db.")
+    with ptc.cassandra_session():
+        last_config = get_last_registered_config()
+        if last_config:
+            now = pd.Timestamp.now(tz="CET")
+            yesterday = get_yesterday(now)
+            print("yesterday : ", yesterday)
+
+            if mode == "missing":
+                to_alert = get_homes_with_missing_data(last_config, yesterday)
+                if len(to_alert) > 0:
+                    threshold = "{} %".format(MISSING_ALERT_THRESHOLD)
+                    legend = "'home id' > percentage of missing data for 1 day"
+                    mail_content = get_mail_text(
+                        "There is missing data",
+                        threshold, legend, to_alert, yesterday)
+                    print(mail_content)
+                    write_mail_to_file(mail_content, "alert_missing.txt")
+                    send_mail("alert_missing.txt")
+
+            elif mode == "sign":
+                to_alert = get_homes_with_incorrect_signs(last_config, yesterday)
+                if len(to_alert) > 0:
+                    threshold = "{} ".format(SIGN_THRESHOLD)
+                    legend = "'home id ' > \n"
+                    legend += "{'cons_neg = is there any negative consumption values ?', \n"
+                    legend += "'prod_pos = is there any positive production values ?'}}"
+                    mail_content = get_mail_text(
+                        "There are incorrect signs",
+                        threshold, legend, to_alert, yesterday)
+                    print(mail_content)
+                    write_mail_to_file(mail_content, "alert_signs.txt")
+                    send_mail("alert_signs.txt")
+
+        print("No registered config in db.")
 
 
 if __name__ == "__main__":
@@ -9,18 +9,21 @@ __license__ = "MIT"
 # 3rd party packages
 import argparse
 import logging
+import numpy as np
 import pandas as pd
 
 # local source
 from constants import (
     CASSANDRA_KEYSPACE,
-    INSERTS_PER_BATCH,
+    RANGE_READ_DAYS,
     TBL_POWER,
     TBL_RAW
 )
+from home_series import HomeSeries
 import py_to_cassandra as ptc
 from utils import (
     get_dates_between,
+    get_day_slices,
     get_last_registered_config
 )
 
@@ -30,21 +33,17 @@ from utils import (
 # ====================================================================================
 
 
-def save_home_power_data_to_cassandra(hid, cons_prod_df, config):
+def save_home_power_data_to_cassandra(hid, cons_prod, config, writer):
     """
     save power flukso data to cassandra : P_cons, P_prod, P_tot
-    - home : Home object
-        => contains cons_prod_df : timestamp, P_cons, P_prod, P_tot
+    - cons_prod : HomeSeries, columns : P_cons, P_prod, P_tot
+    - writer : ptc.AsyncWriter the rows are fed into
     """
 
     try:
         insertion_time = pd.Timestamp.now(tz="CET")
         config_id = config.get_config_id()
 
-        # add date column
-        cons_prod_df['date'] = cons_prod_df.apply(lambda row: str(row.name.date()), axis=1)
-        by_day_df = cons_prod_df.groupby("date")  # group by date
-
         col_names = [
             "home_id",
             "day",
@@ -55,26 +54,17 @@ def save_home_power_data_to_cassandra(hid, cons_prod_df, config):
             "insertion_time",
             "config_id"
         ]
-        for date, date_rows in by_day_df:  # loop through each group (each date group)
-
-            insert_queries = ""
-            nb_inserts = 0
-            for timestamp, row in date_rows.iterrows():
-                # [:-1] to avoid date column
-                values = [hid, date, timestamp] + list(row)[:-1] + [insertion_time, config_id]
-                insert_queries += ptc.get_insert_query(
-                    CASSANDRA_KEYSPACE,
-                    TBL_POWER,
-                    col_names,
-                    values
-                )
-
-                if (nb_inserts + 1) % INSERTS_PER_BATCH == 0:
-                    ptc.batch_insert(insert_queries)
-                    insert_queries = ""
-
-                nb_inserts += 1
-            ptc.batch_insert(insert_queries)
+        # timestamps are bound as epochs in milliseconds
+        epochs_ms = (cons_prod.epochs // 10**6).tolist()
+        powers = cons_prod.values.tolist()
+        for date, start, stop in get_day_slices(cons_prod.get_index()):
+            rows = [
+                (hid, date, epochs_ms[i]) + tuple(powers[i]) + (insertion_time, config_id)
+                for i in range(start, stop)
+            ]
+            writer.insert(
+                CASSANDRA_KEYSPACE, TBL_POWER, col_names, rows, ["home_id", "day"]
+            )
     except Exception:
         logging.critical(
             "Exception occured in 'save_home_power_data_to_cassandra' : {}".format(hid),
@@ -87,26 +77,62 @@ def save_home_power_data_to_cassandra(hid, cons_prod_df, config):
 # =====================================================================================
 
 
-def get_home_raw_data(home, date):
+def get_home_raw_data(home, dates):
     """
-    Function to query raw data in the database according to a day.
+    Function to query raw data in the database according to several days.
+    1 query per sensor and per day, processed concurrently.
 
     :param home:    Dataframe with the home configuration.
-    :param date:    The date to recover data.
+    :param dates:   The dates to recover data.
 
-    :return:        Return a concatenated dataframe with all sensors.
+    :return:        Return a dictionary with key : date, value : a concatenated
+                    dataframe with all sensors.
                     columns -> ["sensor_id, day, ts, power"].
     """
-    home_raw_data = []
-    for sid in home.index:
-        raw_data_df = ptc.select_query(
-            CASSANDRA_KEYSPACE,
-            TBL_RAW,
-            ["sensor_id, day, ts, power"],
-            f"sensor_id = '{sid}' and day = '{date}'"
-        )
-        home_raw_data.append(raw_data_df)
-    return pd.concat(home_raw_data)
+    return ptc.select_range(
+        CASSANDRA_KEYSPACE,
+        TBL_RAW,
+        ["sensor_id", "day", "ts", "power"],
+        "sensor_id",
+        list(home.index),
+        dates
+    )
+
+
+def get_coefficients(sensors_config, sensors_ids):
+    """
+    Get the production and network coefficients of sensors as 2 vectors
+    (same order as sensors_ids)
+    """
+    coefficients = sensors_config.loc[list(sensors_ids), ["pro", "net"]].values.astype(np.float64)
+    return coefficients[:, 0], coefficients[:, 1]
+
+
+def compute_powers(powers, sensors_ids, sensors_config):
+    """
+    Compute P_cons, P_prod, P_tot from the power of each sensor of a home
+    (1 column per sensor) with 2 matrix-vector products :
+    P_prod = powers . pro, missing powers count as 0
+    P_tot = powers . net, missing powers count as 0 if net == 0, else P_tot is missing
+    P_cons = P_tot - P_prod
+    - powers : matrix with 1 row per timestamp, 1 column per sensor of sensors_ids
+    Used by the live sync and the recomputation : the sensors are sorted so that
+    both give the same results from the same data. A sensor given in several
+    columns is counted once (its first column), its coefficients are applied once.
+
+    return a matrix with 1 row per timestamp, columns : P_cons, P_prod, P_tot
+    (rounded to 1 decimal)
+    """
+    # sorted sensor ids, position of the first column of each one
+    sensors_ids, columns = np.unique(np.array(sensors_ids, dtype=object), return_index=True)
+    pro, net = get_coefficients(sensors_config, sensors_ids)
+    powers = powers[:, columns].astype(np.float64)
+    missing = np.isnan(powers)
+
+    p_prod = np.where(missing, 0., powers) @ pro
+    p_tot = np.where(missing & (net == 0), 0., powers) @ net
+
+    return np.column_stack([p_tot - p_prod, p_prod, p_tot]).round(1)
 
 
 def get_consumption_production_df(raw_df, sensors_config):
@@ -115,24 +141,23 @@ def get_consumption_production_df(raw_df, sensors_config):
     P_net = P_prod + P_cons
     cons_prod_df : timestamp, P_cons, P_prod, P_tot
     """
-    cons_prod_df = pd.DataFrame(
-        0,
+    return pd.DataFrame(
+        compute_powers(raw_df.values, raw_df.columns, sensors_config),
         raw_df.index,
         ["P_cons", "P_prod", "P_tot"]
     )
 
-    for sid in raw_df.columns:
-        p = sensors_config.loc[sid]["pro"]
-        n = sensors_config.loc[sid]["net"]
-
-        cons_prod_df["P_prod"] += raw_df[sid].multiply(p, fill_value=0)
-        cons_prod_df["P_tot"] += raw_df[sid].multiply(n, fill_value=0 if n == 0 else None)
 
-    cons_prod_df["P_cons"] = cons_prod_df["P_tot"] - cons_prod_df["P_prod"]
-
-    cons_prod_df = cons_prod_df.round(1)  # round all column values with 2 decimals
-
-    return cons_prod_df
+def get_consumption_production_series(raw, sensors_config):
+    """
+    Same as 'get_consumption_production_df', from and to a HomeSeries
+    (P_cons, P_prod, P_tot as float32, like the power table)
+    """
+    return HomeSeries(
+        raw.epochs,
+        compute_powers(raw.values, raw.columns, sensors_config).astype(np.float32),
+        ["P_cons", "P_prod", "P_tot"]
+    )
 
 
 def get_home_consumption_production_df(home_raw_data, home_config):
@@ -140,6 +165,7 @@ def get_home_consumption_production_df(home_raw_data, home_config):
     compute power data from raw data (coming from cassandra 'raw' table) :
     P_cons = P_tot - P_prod
     P_net = P_prod + P_cons
+    The sensors are aligned on their timestamps.
 
     :param home_raw_data:   Dataframe with all sensors.
                             columns -> ["sensor_id, day, ts, power"].
@@ -147,39 +173,25 @@ def get_home_consumption_production_df(home_raw_data, home_config):
 
     :return:                Return a dataframe with computed power data.
     """
-    grouped_sensors = home_raw_data.groupby('sensor_id')
-    first_group = grouped_sensors.get_group(home_raw_data.iloc[0, 0])
-    cons_prod_df = (
-        pd.DataFrame(columns=['home_id', 'day', 'ts', 'P_cons', 'P_prod', 'P_tot'])
-        .assign(
-            day=first_group['day'],
-            ts=first_group['ts'],
-            home_id=home_config.iloc[0, 0],
-            P_cons=0,
-            P_prod=0,
-            P_tot=0
-        )
-    )
+    # 1 row per (day, timestamp), 1 column per sensor
+    raw_df = home_raw_data.set_index(["day", "ts", "sensor_id"])["power"].unstack("sensor_id")
+    powers = compute_powers(raw_df.values, raw_df.columns, home_config)
 
-    for sid, sensor_df in grouped_sensors:
-        p = home_config.loc[sid]["pro"]
-        n = home_config.loc[sid]["net"]
-
-        cons_prod_df["P_prod"] += sensor_df["power"].multiply(p, fill_value=0)
-        cons_prod_df["P_tot"] += sensor_df["power"].multiply(n, fill_value=0 if n == 0 else None)
-
-    cons_prod_df["P_cons"] = cons_prod_df["P_tot"] - cons_prod_df["P_prod"]
-
-    cons_prod_df = cons_prod_df.round(1)  # round all column values with 1 decimals
+    cons_prod_df = raw_df.index.to_frame(index=False)
+    cons_prod_df.insert(0, "home_id", home_config["home_id"].iloc[0])
+    cons_prod_df["P_cons"] = powers[:, 0]
+    cons_prod_df["P_prod"] = powers[:, 1]
+    cons_prod_df["P_tot"] = powers[:, 2]
 
     return cons_prod_df
 
 
-def save_recomputed_powers_to_cassandra(new_config_id, cons_prod_df):
+def save_recomputed_powers_to_cassandra(new_config_id, cons_prod_df, writer):
     """
     Save the powers (P_cons, P_prod, P_tot) of the raw data
     of some period of time in Cassandra for 1 specific home
     - cons_prod_df : home_id, day, ts, p_cons, p_prod, p_tot
+    - writer : ptc.AsyncWriter the rows are fed into
 
     We assume that the data is of 1 specific date.
     """
@@ -194,26 +206,11 @@ def save_recomputed_powers_to_cassandra(new_config_id, cons_prod_df):
         "config_id",
         "insertion_time"
     ]
-    insert_queries = ""
-    nb_inserts = 0
-
-    for _, row in cons_prod_df.iterrows():
-        values = list(row)
-        values.append(new_config_id)
-        values.append(insertion_time)
-        insert_queries += ptc.get_insert_query(
-            CASSANDRA_KEYSPACE,
-            TBL_POWER,
-            col_names,
-            values
-        )
-        if (nb_inserts + 1) % INSERTS_PER_BATCH == 0:
-            ptc.batch_insert(insert_queries)
-            insert_queries = ""
-
-        nb_inserts += 1
-
-    ptc.batch_insert(insert_queries)
+    rows = [
+        tuple(row) + (new_config_id, insertion_time)
+        for row in cons_prod_df.itertuples(index=False, name=None)
+    ]
+    writer.insert(CASSANDRA_KEYSPACE, TBL_POWER, col_names, rows, ["home_id", "day"])
 
 
 def get_data_dates_from_home(sensors_df):
@@ -239,53 +236,76 @@ def get_data_dates_from_home(sensors_df):
     return all_dates
 
 
-def exist_home_power_data(home_id, date):
+def get_home_power_dates(home_id, dates):
     """
-    From a home, query the first date in the raw data.
-    return True if there is at least 1 row of data for this home,
-    given the specified date.
+    From a home, return the dates (among 'dates') with at least 1 row
+    of power data for this home.
     """
-    first_date_df = ptc.select_query(
+    first_rows = ptc.select_range(
         CASSANDRA_KEYSPACE,
         TBL_POWER,
         ["p_cons"],
-        "home_id = '{}' and day = '{}'".format(home_id, date),
+        "home_id",
+        [home_id],
+        dates,
         limit=1
     )
-    return len(first_date_df) > 0
+    return [date for date in dates if len(first_rows[date]) > 0]
+
+
+def recompute_home_power_data(hid, home_config, dates, config_id, writer):
+    """
+    Recompute the power data of 1 home for some dates, and store it in the
+    database (overwrite existing data).
+    """
+    power_dates = get_home_power_dates(hid, dates)
+    for date in dates:
+        if date not in power_dates:
+            logging.debug(f"No data for the date {date}")
+
+    home_raw_data = get_home_raw_data(home_config, power_dates)
+    for date in power_dates:
+        if len(home_raw_data[date]) > 0:
+            home_powers = get_home_consumption_production_df(home_raw_data[date], home_config)
+            # save (overwrite) to cassandra table
+            if len(home_powers) > 0:
+                save_recomputed_powers_to_cassandra(config_id, home_powers, writer)
 
 
 def recompute_power_data(last_config, dates=None):
     """
     Given a configuration, recompute all power data for all homes
     based on the existing raw data stored in Cassandra.
+    Data is fetched by windows of RANGE_READ_DAYS days.
 
     :param last_config: Configuration file.
     :param dates:       List of dates.
     """
+    writer = ptc.AsyncWriter()
     # Get a dataframe of the new configuration file and we groupby home_id.
-    for hid, home_config in last_config.get_sensors_config().groupby("home_id"):
+    for hid in last_config.get_home_ids():
+        home_config = last_config.get_home_config(hid)
         # first select all dates registered for this home
-        if dates is None:
-            dates = get_data_dates_from_home(home_config)
-
-        if len(dates) > 0:
-            # then, for each day, recompute data and store it in the database
-            # (overwrite existing data)
-            for date in dates:
-                if exist_home_power_data(hid, date):
-                    home_raw_data = get_home_raw_data(home_config, date)
-                    home_powers = get_home_consumption_production_df(home_raw_data, home_config)
-                    # save (overwrite) to cassandra table
-                    if len(home_powers) > 0:
-                        save_recomputed_powers_to_cassandra(
-                            last_config.get_config_id(), home_powers
-                        )
-                else:
-                    logging.debug(f"No data for the date {date}")
+        home_dates = dates
+        if home_dates is None:
+            home_dates = get_data_dates_from_home(home_config)
+
+        if len(home_dates) > 0:
+            # then, for each window of days, recompute data
+            for i in range(0, len(home_dates), RANGE_READ_DAYS):
+                recompute_home_power_data(
+                    hid,
+                    home_config,
+                    home_dates[i:i + RANGE_READ_DAYS],
+                    last_config.get_config_id(),
+                    writer
+                )
         else:
             logging.debug("No date to process")
 
+    # wait for all the power rows to be written
+    writer.flush()
+
 
 # ====================================================================================
 
@@ -318,16 +338,19 @@ def process_arguments():
 def main():
     argparser = process_arguments()
     args = argparser.parse_args()
-    last_config = get_last_registered_config()
-    # If the configuration exists
-    if last_config:
-        # Check if we want to do a daily recomputation or not
-        if args.daily:
-            recompute_power_data(last_config, [(pd.Timestamp.now() - pd.Timedelta(days=1)).date()])
+    with ptc.cassandra_session():
+        last_config = get_last_registered_config()
+        # If the configuration exists
+        if last_config:
+            # Check if we want to do a daily recomputation or not
+            if args.daily:
+                recompute_power_data(
+                    last_config, [(pd.Timestamp.now() - pd.Timedelta(days=1)).date()]
+                )
+            else:
+                recompute_power_data(last_config)
         else:
-            recompute_power_data(last_config)
-    else:
-        logging.debug("No registered config in db.")
+            logging.debug("No registered config in db.")
 
 
 if __name__ == "__main__":
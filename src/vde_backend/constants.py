@@ -19,6 +19,9 @@ CONFIG_CAPTIONS_TAB = "InstallationCaptions"
 # Path to local databases.
 TMPO_FILE = "/opt/vde/" if PROD else ""
 SFTP_LOCAL_PATH = "/opt/vde/sftp_data/" if PROD else "../../output/sftp_data/"
+# Local copies of the last registered sensors config (1 file per config id).
+# Set None to disable.
+CONFIG_CACHE_PATH = "/opt/vde/config_cache/" if PROD else "../../output/config_cache/"
 
 # Log files.
 LOG_FILE = "/var/log/vde/prod.log" if PROD else "/var/log/vde/test.log"
@@ -37,17 +40,52 @@ FREQ = [8, "S"]  # 8 sec.
 
 # missing raw data time limit = keep data from max X time back from now
 LIMIT_TIMING_RAW = 2  # days
+# True : record every interval of missing raw data of a sensor in the raw missing table.
+# False : only record 1 interval per sensor, from its first missing timestamp.
+RECORD_ALL_GAPS = False
 
 # Period back in time to fetch Flukso data. Will be ignored in production mode.
 # Set None to disable.
 FROM_FIRST_TS = "5770min"
 
-# nb lines to insert per batch insert when inserting in cassandra table
-INSERTS_PER_BATCH = 11000
+# max estimated size (bytes) of a batch insert when inserting in cassandra table.
+# Keep it below cassandra's 'batch_size_fail_threshold_in_kb' (50 kB by default).
+BATCH_MAX_BYTES = 40 * 1024
 
 # Threshold of holes
 GAP_THRESHOLD = '4h'
 
+# kernel converting cumulative energy to power :
+# "numba" (compiled, needs the numba package), "numpy", or "auto" (numba if installed)
+ENERGY2POWER_ENGINE = "auto"
+
+# nb processes syncing homes in parallel (sync_flukso). 1 = sequential sync.
+SYNC_WORKERS = 1
+# True : the interval of a home is read and computed at once, then saved day by day
+# while the next homes are computed. False : the interval is processed day by day.
+SYNC_SPAN = False
+# span mode : stages of the sync pipeline, and nb threads of each stage.
+# 1 serialize and 1 write thread keep the rows of a home in order (raw last ts table)
+SYNC_STAGES = ["fetch", "compute", "serialize", "write"]
+SYNC_STAGE_WORKERS = {"fetch": 2, "compute": 2, "serialize": 1, "write": 1}
+# max nb items waiting between 2 stages of the sync pipeline
+SYNC_QUEUE_SIZE = 4
+
+# tmpo synchronization (see tmpo_sync) :
+# nb sensors whose blocks are downloaded in parallel
+TMPO_SYNC_WORKERS = 16
+# max time (seconds) to download the new blocks of 1 sensor, per attempt
+TMPO_SYNC_TIMEOUT = 60
+# nb attempts per sensor. Waiting time before the n-th retry : TMPO_SYNC_BACKOFF * 2^(n-1) sec.
+TMPO_SYNC_ATTEMPTS = 3
+TMPO_SYNC_BACKOFF = 2
+# a sensor failing all its attempts is not synced again before this delay
+TMPO_QUARANTINE = "1h"
+# a sensor synced less than TMPO_MIN_SYNC_INTERVAL seconds ago is not synced again
+TMPO_MIN_SYNC_INTERVAL = 60
+# max memory (bytes) of the decoded tmpo blocks kept in cache when reading (see tmpo_reader)
+TMPO_BLOCK_CACHE_BYTES = 256 * 1024 ** 2
+
 # =========================== CASSANDRA =======================================
 # cassandra keyspaces
 CASSANDRA_KEYSPACE = "flukso" if PROD else "test"
@@ -55,12 +93,39 @@ CASSANDRA_KEYSPACE = "flukso" if PROD else "test"
 CASSANDRA_REPLICATION_STRATEGY = 'SimpleStrategy'
 # The replication factor must not exceed the number of nodes in the cluster.
 CASSANDRA_REPLICATION_FACTOR = 1
+# max number of asynchronous write requests in flight at the same time
+WRITE_CONCURRENCY = 64
+
+# cassandra session
+CASSANDRA_LOCAL_DC = "datacenter1"
+CASSANDRA_PROTOCOL_VERSION = 4
+# request timeouts in seconds (None = no timeout)
+CASSANDRA_WRITE_TIMEOUT = 30
+CASSANDRA_READ_TIMEOUT = None
+# consistency levels (names of cassandra.ConsistencyLevel) per operation type
+CASSANDRA_WRITE_CONSISTENCY = "LOCAL_ONE"
+CASSANDRA_READ_CONSISTENCY = "LOCAL_ONE"
+# speculative execution for reads : delay (seconds) before querying another replica.
+# Set None to disable.
+CASSANDRA_SPECULATIVE_DELAY = None
+CASSANDRA_SPECULATIVE_ATTEMPTS = 2
+
+# nb rows per page of a select query
+SELECT_FETCH_SIZE = 5000
+# max estimated memory (bytes) of the result of a select query. Set None to disable.
+SELECT_MAX_BYTES = 2 * 1024 ** 3
+# max number of asynchronous select queries in flight at the same time (range reads)
+READ_CONCURRENCY = 32
+# nb days fetched at once by range reads
+RANGE_READ_DAYS = 30
 
 # cassandra tables names
 TBL_ACCESS = "access"
 TBL_SENSORS_CONFIG = "sensors_config"
+TBL_CURRENT_CONFIG = "current_config"
 TBL_RAW = "raw"
 TBL_RAW_MISSING = "raw_missing"
+TBL_RAW_LAST_TS = "raw_last_ts"
 TBL_POWER = "power"
 TBL_GROUP = "group"
 TBL_RTU_DATA = "rtu"
@@ -36,7 +36,7 @@ import py_to_cassandra as ptc
 from utils import (
     get_dates_between,
     get_last_registered_config,
-    get_home_power_data_from_cassandra,
+    get_home_power_data_chunks,
     is_earlier
 )
 
@@ -44,16 +44,24 @@ from utils import (
 # ==============================================================================
 
 
-def save_data_to_csv(data_df, csv_filename, output_filename):
+def save_data_to_csv(data_chunks, csv_filename, output_filename):
     """
-    Save to csv
+    Save to csv, chunk by chunk (DataFrames) to limit memory usage
     """
 
     if not os.path.exists(output_filename):
         os.mkdir(output_filename)
     filepath = os.path.join(output_filename, csv_filename)
 
-    data_df.to_csv(filepath)
+    header = True
+    for chunk in data_chunks:
+        if len(chunk) > 0 or header:
+            chunk.set_index("home_id").to_csv(
+                filepath,
+                mode='w' if header else 'a',
+                header=header
+            )
+            header = False
 
     print("Successfully Saved data in csv")
 
@@ -147,15 +155,16 @@ def process_all_homes(now, homes, specific_days, output_filename):
     for home_id in homes:
         all_dates = get_dates(home_id, specific_days, now, output_filename)
 
+        # 1 day at a time, page by page : the export stays streamed
         for date in all_dates:
             csv_filename = "{}_{}.csv".format(home_id, date)
             print(csv_filename)
-            home_data = get_home_power_data_from_cassandra(
+            home_data = get_home_power_data_chunks(
                 home_id,
                 date
             )
 
-            save_data_to_csv(home_data.set_index("home_id"), csv_filename, output_filename)
+            save_data_to_csv(home_data, csv_filename, output_filename)
 
         print("-----------------------")
 
@@ -169,7 +178,7 @@ def get_homes(config, specific_home):
     if specific_home != "":
         homes.append(specific_home)
     else:
-        homes = config.get_ids().keys()
+        homes = config.get_home_ids()
 
     return homes
 
@@ -276,27 +285,28 @@ def main():
 
     specific_days = get_specific_days(specific_day, start_day, end_day)
 
-    config = get_last_registered_config()
+    with ptc.cassandra_session():
+        config = get_last_registered_config()
 
-    if config:
-        now = pd.Timestamp.now()
+        if config:
+            now = pd.Timestamp.now()
 
-        print("config id : " + str(config.get_config_id()))
-        print("specific home : " + ("/" if not specific_home else specific_home))
-        print("specific range : " + ("/" if not start_day
-                                     else "{} -> {}".format(start_day, end_day)))
-        print("specific day : " + ("/" if not specific_day else specific_day))
+            print("config id : " + str(config.get_config_id()))
+            print("specific home : " + ("/" if not specific_home else specific_home))
+            print("specific range : " + ("/" if not start_day
+                                         else "{} -> {}".format(start_day, end_day)))
+            print("specific day : " + ("/" if not specific_day else specific_day))
 
-        homes = get_homes(config, specific_home)
+            homes = get_homes(config, specific_home)
 
-        process_all_homes(
-            now,
-            homes,
-            specific_days,
-            output_filename
-        )
-    else:
-        print("No registered config in db.")
+            process_all_homes(
+                now,
+                homes,
+                specific_days,
+                output_filename
+            )
+        else:
+            print("No registered config in db.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+__title__ = "home_series"
+__version__ = "2.0.0"
+__author__ = "Alexandre Heneffe, Guillaume Levasseur, and Brice Petit"
+__license__ = "MIT"
+
+
+"""
+Compact in-memory time series of the sensors of 1 home, used by the sync from
+the tmpo extraction to the writer : int64 epochs and a plain NumPy matrix
+(float64 for the cumulative energy, float32 for the powers, like the FLOAT
+columns of the raw and power tables). Pandas objects are only built at the edges.
+"""
+
+
+# 3rd party packages
+import numpy as np
+import pandas as pd
+
+
+class HomeSeries:
+    __slots__ = ("epochs", "values", "columns")
+
+    def __init__(self, epochs, values, columns):
+        self.epochs = epochs        # int64 epochs in nanoseconds (UTC), sorted
+        self.values = values        # matrix : 1 row per epoch, 1 column per sensor
+        self.columns = columns      # list of column names (sensor ids)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    @classmethod
+    def empty(cls, columns=()):
+        return cls(
+            np.empty(0, dtype=np.int64),
+            np.empty((0, len(columns)), dtype=np.float32),
+            list(columns)
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays, columns, dtype=np.float64):
+        """
+        Align series given as (epochs, values) arrays (1 per column) on the union
+        of their epochs, missing values are nan.
+        """
+        if len(arrays) == 0:
+            return cls.empty(columns)
+        epochs = np.unique(np.concatenate([series_epochs for series_epochs, _ in arrays]))
+
+        values = np.full((len(epochs), len(arrays)), np.nan, dtype=dtype)
+        for col, (series_epochs, series_values) in enumerate(arrays):
+            values[np.searchsorted(epochs, series_epochs), col] = series_values
+        return cls(epochs, values, list(columns))
+
+    @classmethod
+    def concat_columns(cls, series_list):
+        """
+        Put the columns of several HomeSeries side by side, aligned on the union
+        of their epochs, missing values are nan.
+        """
+        epochs = np.unique(np.concatenate([series.epochs for series in series_list]))
+        dtype = np.result_type(*[series.values.dtype for series in series_list])
+        columns = [col for series in series_list for col in series.columns]
+
+        values = np.full((len(epochs), len(columns)), np.nan, dtype=dtype)
+        col = 0
+        for series in series_list:
+            nb_cols = len(series.columns)
+            values[np.searchsorted(epochs, series.epochs), col:col + nb_cols] = series.values
+            col += nb_cols
+        return cls(epochs, values, columns)
+
+    def slice(self, start, stop):
+        """
+        Get a HomeSeries with only the rows start to stop (excluded), without copy
+        """
+        return HomeSeries(self.epochs[start:stop], self.values[start:stop], self.columns)
+
+    def select(self, columns):
+        """
+        Get a HomeSeries with only some columns, in the order of 'columns'
+        """
+        positions = {col: i for i, col in enumerate(self.columns)}
+        return HomeSeries(
+            self.epochs, self.values[:, [positions[col] for col in columns]], list(columns)
+        )
+
+    def isna(self):
+        return np.isnan(self.values)
+
+    def get_index(self, tz="CET"):
+        """
+        Get the timestamps as a DatetimeIndex in the timezone 'tz'
+        """
+        return pd.to_datetime(self.epochs, utc=True).tz_convert(tz)
+
+    def to_frame(self, tz="CET"):
+        return pd.DataFrame(self.values, index=self.get_index(tz), columns=self.columns)
@@ -0,0 +1,185 @@
+__title__ = "pipeline"
+__version__ = "2.0.0"
+__author__ = "Alexandre Heneffe, Guillaume Levasseur, and Brice Petit"
+__license__ = "MIT"
+
+
+"""
+Pipeline of stages run by threads and connected by bounded queues : each stage
+takes its items from its input queue and puts its results in the input queue of
+the next stage. A full queue blocks the previous stage (back-pressure), so that
+the number of items in memory is bounded.
+When all the workers of a stage are done, the next stage receives 1 end marker
+per worker : the pipeline is drained stage by stage, then it returns.
+An item failing in a stage is logged and dropped : it does not stop the pipeline.
+"""
+
+
+# standard library
+import logging
+import queue
+import threading
+import time
+
+
+# end of the items of a queue
+END = object()
+
+
+class Stage:
+    def __init__(self, name, func, workers=1, init=None, close=None, expand=False):
+        self.name = name
+        # called with each item (and the worker state if 'init' is given),
+        # returns the item for the next stage (None : no item)
+        self.func = func
+        self.workers = workers
+        # called by each worker before its first item, returns its state
+        self.init = init
+        # called with the worker state when the worker ends
+        self.close = close
+        # True : 'func' returns an iterable of items for the next stage
+        self.expand = expand
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size):
+        self.stages = stages
+        # queues[i] : input of stages[i]
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.lock = threading.Lock()
+        self.running = [stage.workers for stage in stages]
+        # key : stage name, value : counters of the stage
+        self.stats = {
+            stage.name: {
+                "items": 0,         # nb items processed
+                "errors": 0,        # nb items failed
+                "busy": 0.,         # time spent (seconds) processing items, all workers
+                "blocked": 0.,      # time spent (seconds) waiting for the next queue
+                "max_depth": 0,     # max nb items in the input queue
+                "sum_depth": 0,     # sum of the input queue depths, at each item taken
+            }
+            for stage in stages
+        }
+
+    def run(self, items):
+        """
+        Feed the items to the first stage, and wait for all the stages to end
+        return the stats of each stage
+        """
+        threads = [
+            threading.Thread(target=self.work, args=(i,), name="{}-{}".format(stage.name, n))
+            for i, stage in enumerate(self.stages)
+            for n in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for item in items:
+                self.queues[0].put(item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                self.queues[0].put(END)
+            for thread in threads:
+                thread.join()
+
+        return self.stats
+
+    def work(self, i):
+        """
+        Worker of the stage i : process the items of its queue until the end marker
+        """
+        stage = self.stages[i]
+        state = None
+        item = None
+        try:
+            if stage.init is not None:
+                state = stage.init()
+            while True:
+                depth = self.queues[i].qsize()
+                item = self.queues[i].get()
+                if item is END:
+                    break
+                self.process(i, state, item, depth)
+        except BaseException:
+            # also a SystemExit in a stage : the worker ends, without leaking
+            # the exception out of its thread
+            logging.critical(
+                "Exception occured in pipeline stage '{}' : ".format(stage.name), exc_info=True
+            )
+        finally:
+            # stopped before the end marker : drain the queue,
+            # so that the previous stage is not blocked
+            while item is not END:
+                item = self.queues[i].get()
+            if state is not None and stage.close is not None:
+                stage.close(state)
+            self.end(i)
+
+    def process(self, i, state, item, depth):
+        """
+        Process 1 item in the stage i, send its results to the next stage
+        - depth : nb items in the input queue when the item was taken
+        """
+        stage = self.stages[i]
+        t = time.time()
+        blocked = 0.
+        failed = False
+        try:
+            if stage.init is not None:
+                result = stage.func(state, item)
+            else:
+                result = stage.func(item)
+            for result in (result if stage.expand else [result]):
+                t_send = time.time()
+                self.send(i, result)
+                blocked += time.time() - t_send
+        except Exception:
+            logging.critical(
+                "Exception occured in pipeline stage '{}' : ".format(stage.name), exc_info=True
+            )
+            failed = True
+
+        with self.lock:
+            stats = self.stats[stage.name]
+            stats["items"] += 1
+            stats["errors"] += failed
+            stats["busy"] += time.time() - t - blocked
+            stats["blocked"] += blocked
+            stats["max_depth"] = max(stats["max_depth"], depth)
+            stats["sum_depth"] += depth
+
+    def send(self, i, item):
+        if item is not None and i + 1 < len(self.stages):
+            self.queues[i + 1].put(item)
+
+    def end(self, i):
+        """
+        A worker of the stage i is done : the last one ends the next stage
+        """
+        with self.lock:
+            self.running[i] -= 1
+            last = self.running[i] == 0
+        if last and i + 1 < len(self.stages):
+            for _ in range(self.stages[i + 1].workers):
+                self.queues[i + 1].put(END)
+
+
+def show_pipeline_stats(stats):
+    """
+    Display the items processed by each stage, its busy time, the time it was blocked
+    by the next stage and the depth of its input queue
+    """
+    for name, stage_stats in stats.items():
+        logging.info(
+            "> Stage {:<10} {} items ({} failed), busy {:.2f} s, blocked {:.2f} s, "
+            "input queue depth : max {}, mean {:.1f}".format(
+                name,
+                stage_stats["items"],
+                stage_stats["errors"],
+                stage_stats["busy"],
+                stage_stats["blocked"],
+                stage_stats["max_depth"],
+                stage_stats["sum_depth"] / max(stage_stats["items"], 1)
+            )
+        )
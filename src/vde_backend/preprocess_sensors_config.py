@@ -14,6 +14,7 @@ import pandas as pd
 # local source
 from constants import (
     TBL_ACCESS,
+    TBL_CURRENT_CONFIG,
     TBL_GROUP,
     TBL_POWER,
     TBL_SENSORS_CONFIG,
@@ -131,6 +132,19 @@ def write_sensors_config_cassandra(new_config, now):
     print("Successfully inserted sensors config in table '{}'".format(TBL_SENSORS_CONFIG))
 
 
+def write_current_config_cassandra(now):
+    """
+    Point the current config pointer to the config inserted at 'now'.
+    Written after the config rows : readers always find the rows of the pointed config.
+    """
+    ptc.insert(
+        CASSANDRA_KEYSPACE,
+        TBL_CURRENT_CONFIG,
+        ["name", "config_id"],
+        [TBL_SENSORS_CONFIG, now]
+    )
+
+
 # ==========================================================================
 
 
@@ -222,6 +236,26 @@ def create_table_sensor_config(table_name):
     )
 
 
+def create_table_current_config(table_name):
+    """
+    create a table with 1 row pointing to the current (last registered) sensors config
+    name ('sensors_config'), config id (insertion time of the config)
+    """
+    cols = [
+        "name TEXT",
+        "config_id TIMESTAMP"
+    ]
+
+    ptc.create_table(
+        CASSANDRA_KEYSPACE,
+        table_name,
+        cols,
+        ["name"],
+        [],
+        {}
+    )
+
+
 def create_table_groups_config(table_name):
     """
     create a table with groups config
@@ -291,6 +325,7 @@ def create_tables():
     create tables if necessary (if they do not already exist)
     """
     create_table_sensor_config(TBL_SENSORS_CONFIG)
+    create_table_current_config(TBL_CURRENT_CONFIG)
     create_table_access(TBL_ACCESS)
     create_table_group(TBL_GROUP)
 
@@ -307,6 +342,7 @@ def save_config(config_file_path, new_config, now):
     # > fill config tables using excel configuration file
     print("> Writing new config in cassandra...")
     write_sensors_config_cassandra(new_config, now)
+    write_current_config_cassandra(now)
 
     # write login and group ids to 'access' cassandra table
     write_access_data_cassandra(config_file_path, TBL_ACCESS)
@@ -337,11 +373,10 @@ def check_changes(c1_path, c1, c2_path, c2):
 
     if c1 and c2:
         c1_hids = c1.get_home_sensors()
-        for hid, sids_c2 in c2.get_home_sensors().items():
+        for hid, sids_c2 in c2.get_ids().items():
             print("{} : ".format(hid), end="")
-            if hid in c1.get_home_sensors():
-                del c1_hids[hid]
-                sids_c1 = c1.get_home_sensors()[hid]
+            if hid in c1_hids:
+                sids_c1 = c1_hids.pop(hid)
                 if set(sids_c2) == set(sids_c1):
                     print("Same sensor ids")
                     config_c1 = c1.get_home_config(hid).sort_index()[['net', 'pro', 'con']]
@@ -444,13 +479,14 @@ def main():
     # Define the current time once for consistency of the insert time between tables.
     now = pd.Timestamp.now(tz="CET")
 
-    create_tables()
+    with ptc.cassandra_session():
+        create_tables()
 
-    process_configs(
-        old_config_path,
-        new_config_path,
-        now
-    )
+        process_configs(
+            old_config_path,
+            new_config_path,
+            now
+        )
 
 
 if __name__ == "__main__":
@@ -9,9 +9,16 @@ import cassandra
 import cassandra.auth
 import cassandra.cluster
 import cassandra.policies
+import cassandra.query
+import collections
+import contextlib
+import datetime
 import json
 import logging
+import numbers
 import os.path
+import threading
+import numpy as np
 import pandas as pd
 
 # local source
@@ -20,9 +27,26 @@ from constants import (
     SERVER_BACKEND_IP,
     CASSANDRA_REPLICATION_STRATEGY,
     CASSANDRA_REPLICATION_FACTOR,
-    CASSANDRA_KEYSPACE
+    CASSANDRA_KEYSPACE,
+    CASSANDRA_LOCAL_DC,
+    CASSANDRA_PROTOCOL_VERSION,
+    CASSANDRA_WRITE_TIMEOUT,
+    CASSANDRA_READ_TIMEOUT,
+    CASSANDRA_WRITE_CONSISTENCY,
+    CASSANDRA_READ_CONSISTENCY,
+    CASSANDRA_SPECULATIVE_DELAY,
+    CASSANDRA_SPECULATIVE_ATTEMPTS,
+    BATCH_MAX_BYTES,
+    SELECT_FETCH_SIZE,
+    SELECT_MAX_BYTES,
+    READ_CONCURRENCY,
+    WRITE_CONCURRENCY
 )
 
+# execution profiles per operation type
+WRITE_PROFILE = "bulk_write"
+READ_PROFILE = "point_read"
+
 
 def load_json_credentials(path: str):
     cred = {}
@@ -56,14 +80,97 @@ def create_keyspace(session, keyspace_name):
     session.execute(keyspace_query)
 
 
+# columns containing timestamps, stored with UTC timezone in Cassandra
+TIMESTAMP_COLUMNS = [
+    'ts',
+    'config_id',
+    'insertion_time',
+    'start_ts',
+    'end_ts'
+]
+# FLOAT columns of the power values, read as float32
+FLOAT32_COLUMNS = [
+    'power',
+    'p_cons',
+    'p_prod',
+    'p_tot'
+]
+
+
+def pandas_factory(colnames, rows):
+    """
+    used by 'select_res_to_df'
+    Build the DataFrame of a page of rows column by column : timestamp columns
+    as datetime64[ns] (naive UTC) arrays, power columns as float32 arrays.
+    """
+    if len(rows) == 0:
+        return pd.DataFrame(columns=colnames)
+
+    data = {}
+    for col_name, values in zip(colnames, zip(*rows)):
+        if col_name in TIMESTAMP_COLUMNS:
+            data[col_name] = np.array(values, dtype="datetime64[ns]")
+        elif col_name in FLOAT32_COLUMNS:
+            data[col_name] = np.array(values, dtype=np.float32)
+        else:
+            data[col_name] = list(values)
+
+    return pd.DataFrame(data, columns=colnames)
+
+
+def get_execution_profiles():
+    """
+    Get the execution profiles of the session, per operation type
+    - default : schema queries and single inserts
+    - WRITE_PROFILE : bulk writes of raw and power rows
+    - READ_PROFILE : select queries, returning pandas DataFrames. Speculative
+      execution (if enabled) sends the query to another replica when the first
+      one is too slow to answer.
+    """
+    def load_balancing_policy():
+        return cassandra.policies.TokenAwarePolicy(
+            cassandra.policies.DCAwareRoundRobinPolicy(local_dc=CASSANDRA_LOCAL_DC)
+        )
+
+    speculative_policy = None
+    if CASSANDRA_SPECULATIVE_DELAY is not None:
+        speculative_policy = cassandra.policies.ConstantSpeculativeExecutionPolicy(
+            delay=CASSANDRA_SPECULATIVE_DELAY,
+            max_attempts=CASSANDRA_SPECULATIVE_ATTEMPTS
+        )
+
+    return {
+        cassandra.cluster.EXEC_PROFILE_DEFAULT: cassandra.cluster.ExecutionProfile(
+            load_balancing_policy=load_balancing_policy(),
+        ),
+        WRITE_PROFILE: cassandra.cluster.ExecutionProfile(
+            load_balancing_policy=load_balancing_policy(),
+            consistency_level=cassandra.ConsistencyLevel.name_to_value[
+                CASSANDRA_WRITE_CONSISTENCY
+            ],
+            request_timeout=CASSANDRA_WRITE_TIMEOUT,
+        ),
+        READ_PROFILE: cassandra.cluster.ExecutionProfile(
+            load_balancing_policy=load_balancing_policy(),
+            consistency_level=cassandra.ConsistencyLevel.name_to_value[
+                CASSANDRA_READ_CONSISTENCY
+            ],
+            request_timeout=CASSANDRA_READ_TIMEOUT,
+            row_factory=pandas_factory,
+            speculative_execution_policy=speculative_policy,
+        ),
+    }
+
+
 def connect_to_cluster(keyspace):
     """
-    connect to Cassandra Cluster
+    Session factory : connect to Cassandra Cluster
     - either locally : simple, ip = 127.0.0.1:9042, by default
     - or with username and password using AuthProvider, if the credentials file
       exits
+    Requests are routed to a replica of their partition (token aware policy),
+    with the execution profiles of 'get_execution_profiles'.
     """
-    lbp = cassandra.policies.DCAwareRoundRobinPolicy(local_dc='datacenter1')
     auth_provider = None
     try:
         cred = load_json_credentials(CASSANDRA_CREDENTIALS_FILE)
@@ -76,8 +183,8 @@ def connect_to_cluster(keyspace):
         cluster = cassandra.cluster.Cluster(
             contact_points=[SERVER_BACKEND_IP, '127.0.0.1', ],
             port=9042,
-            load_balancing_policy=lbp,
-            protocol_version=4,
+            execution_profiles=get_execution_profiles(),
+            protocol_version=CASSANDRA_PROTOCOL_VERSION,
             auth_provider=auth_provider,
         )
 
@@ -95,7 +202,52 @@ def connect_to_cluster(keyspace):
     return session
 
 
-SESSION = connect_to_cluster(CASSANDRA_KEYSPACE)
+# Cassandra session, connected at the first use (see 'get_session')
+SESSION = None
+SESSION_LOCK = threading.Lock()
+
+# prepared statements of the session, key : (statement type, keyspace, table, columns)
+PREPARED_STATEMENTS = {}
+
+
+def get_session():
+    """
+    Get the Cassandra session. The connection to the cluster is opened at the
+    first call, so that importing this module does not need a cluster.
+    Thread safe.
+    """
+    global SESSION
+    if SESSION is None:
+        with SESSION_LOCK:
+            if SESSION is None:
+                SESSION = connect_to_cluster(CASSANDRA_KEYSPACE)
+
+    return SESSION
+
+
+def close_session():
+    """
+    Close the Cassandra session and the connection to the cluster, if opened.
+    The next 'get_session' opens a new one.
+    """
+    global SESSION
+    with SESSION_LOCK:
+        if SESSION is not None:
+            SESSION.cluster.shutdown()
+            SESSION = None
+            PREPARED_STATEMENTS.clear()
+
+
+@contextlib.contextmanager
+def cassandra_session():
+    """
+    Context manager opening the Cassandra session and closing it on exit.
+    usage : with cassandra_session() as session: ...
+    """
+    try:
+        yield get_session()
+    finally:
+        close_session()
 
 
 def get_right_format(values):
@@ -126,7 +278,7 @@ def delete_rows(keyspace, table_name):
     delete all rows of a table
     """
     query = "TRUNCATE {}.{}".format(keyspace, table_name)
-    SESSION.execute(query)
+    get_session().execute(query)
 
 
 def insert(keyspace, table, columns, values):
@@ -141,35 +293,302 @@ def insert(keyspace, table, columns, values):
     query += "({}) ".format(",".join(columns))
     query += "VALUES ({});".format(",".join(get_right_format(values)))
     logging.debug("===> insert query :" + query)
-    SESSION.execute(query)
+    get_session().execute(query)
 
 
-def get_insert_query(keyspace, table, columns, values):
+def prepare_insert(keyspace, table, columns):
     """
-    Get the prepared statement for an insert query
+    Get the prepared statement of an insert query. The statement is prepared
+    once per process and per (keyspace, table, columns), then reused.
 
-    command : INSERT INTO <keyspace>.<table> (<columns>) VALUES (<values>);
+    command : INSERT INTO <keyspace>.<table> (<columns>) VALUES (?, ?, ...);
     """
+    key = ("INSERT", keyspace, table, tuple(columns))
+    if key not in PREPARED_STATEMENTS:
+        query = "INSERT INTO {}".format(keyspace)
+        query += ".{} ".format(table)
+        query += "({}) ".format(",".join(columns))
+        query += "VALUES ({});".format(",".join(["?"] * len(columns)))
+        logging.debug("===> prepare insert query :" + query)
+        PREPARED_STATEMENTS[key] = get_session().prepare(query)
 
-    query = "INSERT INTO {}".format(keyspace)
-    query += ".{} ".format(table)
-    query += "({}) ".format(",".join(columns))
-    query += "VALUES ({});".format(",".join(get_right_format(values)))
+    return PREPARED_STATEMENTS[key]
 
-    return query
 
+def prepare_delete(keyspace, table, key_columns):
+    """
+    Get the prepared statement of a query deleting 1 row given its primary key.
+    The statement is prepared once per process and per (keyspace, table, columns),
+    then reused.
+
+    command : DELETE FROM <keyspace>.<table> WHERE <column1> = ? AND <column2> = ? ...;
+    """
+    key = ("DELETE", keyspace, table, tuple(key_columns))
+    if key not in PREPARED_STATEMENTS:
+        query = "DELETE FROM {}".format(keyspace)
+        query += ".{} ".format(table)
+        query += "WHERE {};".format(" AND ".join(col + " = ?" for col in key_columns))
+        logging.debug("===> prepare delete query :" + query)
+        PREPARED_STATEMENTS[key] = get_session().prepare(query)
+
+    return PREPARED_STATEMENTS[key]
+
+
+def estimate_size(value):
+    """
+    Estimate the serialized size (bytes) of a value bound to a statement
+    """
+    if isinstance(value, str):
+        return len(value)
+    elif isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    elif isinstance(value, (datetime.datetime, numbers.Number)):
+        return 8
+    elif value is None:
+        return 0
+    return len(str(value))
+
+
+def get_insert_batches(prepared, rows, key_indexes, max_bytes=BATCH_MAX_BYTES):
+    """
+    Bind rows (tuples of values) to a prepared insert (or delete) statement and
+    group them by unlogged single-partition batches
+    - key_indexes : positions of the values forming the partition key in a row.
+        ex: (0, 1) for (sensor_id, day)
+    - a batch is sent as soon as its estimated size reaches 'max_bytes'
+    The rows can come in any order : one batch is kept open per partition key.
+    """
+    # per value : 4 bytes to encode its length, per statement : ~ 20 bytes of header
+    row_overhead = 20 + 4 * len(prepared.column_metadata)
+    open_batches = {}  # key : partition key, value : [batch, estimated size]
+    for row in rows:
+        key = tuple(row[i] for i in key_indexes)
+        if key not in open_batches:
+            open_batches[key] = [
+                cassandra.query.BatchStatement(batch_type=cassandra.query.BatchType.UNLOGGED),
+                0
+            ]
+        batch = open_batches[key]
+        batch[0].add(prepared, row)
+        batch[1] += row_overhead + sum(map(estimate_size, row))
+        if batch[1] >= max_bytes:
+            yield batch[0]
+            del open_batches[key]
+
+    for batch, _ in open_batches.values():
+        yield batch
+
+
+class AsyncWriter:
+    """
+    Pipelined writer built on 'execute_async'.
+    - at most 'concurrency' requests are in flight at the same time : sending a
+      new request blocks until a previous one completes (back-pressure)
+    - the error of each failed request is collected and reported by 'flush'
+    The writer can be shared by several threads.
+    """
+
+    def __init__(self, concurrency=WRITE_CONCURRENCY):
+        self.concurrency = concurrency
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.nb_requests = 0
+        self.errors = []
+
+    def execute(self, statement, description="", group=None):
+        """
+        Send a statement asynchronously, wait for a free slot if the
+        concurrency window is full
+        - group : WriteGroup of the statement, its failure is counted in the group
+        """
+        self.slots.acquire()
+        with self.cond:
+            self.in_flight += 1
+            self.nb_requests += 1
+        try:
+            future = get_session().execute_async(statement, execution_profile=WRITE_PROFILE)
+        except Exception as e:
+            self._on_error(e, description, group)
+        else:
+            future.add_callbacks(
+                callback=self._on_success,
+                errback=self._on_error,
+                errback_args=(description, group)
+            )
 
-def batch_insert(inserts):
+    def insert(self, keyspace, table, columns, rows, partition_by=None, group=None):
+        """
+        Insert rows (tuples of values ordered as 'columns') in a table
+        - partition_by : columns the rows are grouped by in batches,
+            the first column by default. ex: ["sensor_id", "day"]
+        """
+        prepared = prepare_insert(keyspace, table, columns)
+        self._execute_batches(prepared, table, columns, rows, partition_by, group)
+
+    def delete(self, keyspace, table, key_columns, keys, partition_by=None, group=None):
+        """
+        Delete rows given their primary key (tuples of values ordered as 'key_columns')
+        - partition_by : columns the deletions are grouped by in batches,
+            the first column by default.
+        """
+        prepared = prepare_delete(keyspace, table, key_columns)
+        self._execute_batches(prepared, table, key_columns, keys, partition_by, group)
+
+    def _execute_batches(self, prepared, table, columns, rows, partition_by, group):
+        partition_by = partition_by or columns[:1]
+        key_indexes = [columns.index(col) for col in partition_by]
+        for batch in get_insert_batches(prepared, rows, key_indexes):
+            self.execute(batch, table, group)
+
+    def add_error(self, description, exception, group=None):
+        """
+        Collect the error of a failed request, reported by 'flush'.
+        It is also counted in the WriteGroup of the request, if any.
+        """
+        with self.cond:
+            self.errors.append((description, exception))
+        if group is not None:
+            group.fail()
+
+    def flush(self):
+        """
+        Wait for all the in-flight requests to complete
+        return the list of (description, exception) of the failed requests
+        since the last flush
+        """
+        with self.cond:
+            while self.in_flight > 0:
+                self.cond.wait()
+            errors = self.errors
+            nb_requests = self.nb_requests
+            self.errors = []
+            self.nb_requests = 0
+
+        if len(errors) > 0:
+            logging.critical("{} failed write requests out of {}. First error ({}) : {}".format(
+                len(errors),
+                nb_requests,
+                errors[0][0],
+                errors[0][1]
+            ))
+
+        return errors
+
+    def _release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+        self.slots.release()
+
+    def _on_success(self, _rows):
+        self._release()
+
+    def _on_error(self, exception, description, group=None):
+        self.add_error(description, exception, group)
+        self._release()
+
+
+class PendingWrites:
     """
-    Gets a string containing a series of Insert queries
-    and use batch to execute them all at once
-    condition : same partition keys for each insert query for higher performance
+    Same interface as AsyncWriter ('insert', 'delete'), but the rows are only built
+    and kept : they are sent later, by an AsyncWriter, with 'send'.
+    The rows can be built by a thread and sent by another one, and
+    several threads can add rows.
     """
-    query = "BEGIN BATCH "
-    query += inserts
-    query += "APPLY BATCH;"
 
-    SESSION.execute(query)
+    def __init__(self):
+        self.requests = []  # list of (name of the writer method, its arguments)
+        self.nb_rows = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.nb_rows
+
+    def insert(self, keyspace, table, columns, rows, partition_by=None):
+        rows = list(rows)
+        with self.lock:
+            self.nb_rows += len(rows)
+            self.requests.append(("insert", (keyspace, table, columns, rows, partition_by)))
+
+    def delete(self, keyspace, table, key_columns, keys, partition_by=None):
+        keys = list(keys)
+        with self.lock:
+            self.nb_rows += len(keys)
+            self.requests.append(("delete", (keyspace, table, key_columns, keys, partition_by)))
+
+    def send(self, writer):
+        """
+        Feed the rows into the writer (AsyncWriter), in the order they were given
+        """
+        for method, args in self.requests:
+            getattr(writer, method)(*args)
+
+
+class WriteGroup:
+    """
+    Rows fed into an AsyncWriter as a group (ex: the rows of 1 home), with the same
+    interface ('insert', 'delete'), and the rows to write only once all the rows of
+    the group are : 'deferred' (PendingWrites), sent by 'send_deferred'.
+    The failures of the group are counted. The group can be shared by several threads.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.deferred = PendingWrites()
+        self.nb_errors = 0
+        self.nb_unsent = 0  # nb PendingWrites of the group not sent yet
+        self.lock = threading.Lock()
+
+    def new_pending(self):
+        """
+        return a new PendingWrites of rows of the group : the deferred rows
+        are not written until it is sent (see 'send')
+        """
+        with self.lock:
+            self.nb_unsent += 1
+        return PendingWrites()
+
+    def send(self, pending):
+        """
+        Feed the rows of a PendingWrites of the group (see 'new_pending') into the writer
+        """
+        pending.send(self)
+        with self.lock:
+            self.nb_unsent -= 1
+
+    def insert(self, keyspace, table, columns, rows, partition_by=None):
+        try:
+            self.writer.insert(keyspace, table, columns, rows, partition_by, group=self)
+        except Exception as e:
+            self.writer.add_error(table, e, self)
+            raise
+
+    def delete(self, keyspace, table, key_columns, keys, partition_by=None):
+        try:
+            self.writer.delete(keyspace, table, key_columns, keys, partition_by, group=self)
+        except Exception as e:
+            self.writer.add_error(table, e, self)
+            raise
+
+    def fail(self):
+        """
+        Count a failure of the group : its deferred rows will not be written
+        """
+        with self.lock:
+            self.nb_errors += 1
+
+    def send_deferred(self):
+        """
+        Feed the deferred rows into the writer, only if the group did not fail and
+        all its PendingWrites were sent. To call once the writer is flushed.
+        return True if the deferred rows were sent
+        """
+        with self.lock:
+            failed = self.nb_errors > 0 or self.nb_unsent > 0
+        if not failed:
+            self.deferred.send(self.writer)
+        return not failed
 
 
 def get_ordering(ordering):
@@ -202,17 +621,10 @@ def create_table(keyspace, table_name, columns, primary_keys, clustering_keys, o
     query += "{})) ".format(',' + ','.join(clustering_keys) if len(clustering_keys) else '')
     query += "{};".format(get_ordering(ordering))
 
-    SESSION.execute(query)
+    get_session().execute(query)
     logging.debug("===> create table query : " + query)
 
 
-def pandas_factory(colnames, rows):
-    """
-    used by 'select_res_to_df'
-    """
-    return pd.DataFrame(rows, columns=colnames)
-
-
 def convert_columns_timezones(df, tz):
     """
     Given a queried dataframe from Cassandra, convert
@@ -222,45 +634,125 @@ def convert_columns_timezones(df, tz):
     UTC timezone
     """
 
-    ts_columns = [
-        'ts',
-        'config_id',
-        'insertion_time',
-        'start_ts',
-        'end_ts'
-    ]
-    for col_name in ts_columns:
+    for col_name in TIMESTAMP_COLUMNS:
         if col_name in df.columns:
-            # first convert to UTC beause UTC saved timestamps in Cassandra comes up
-            # with no timezone. Ex: stored ts : 'YYYY-MM-DD HH:MM:SS.MMM000+0000'
+            # UTC saved timestamps in Cassandra comes up with no timezone.
+            # Ex: stored ts : 'YYYY-MM-DD HH:MM:SS.MMM000+0000'
             # becomes 'YYYY-MM-DD HH:MM:SS.MMM' when queried.
-            df[col_name] = df[col_name].dt.tz_localize("UTC").dt.tz_convert(tz)
+            # => the int64 values are UTC epochs : set the UTC timezone without
+            # conversion, then convert
+            epochs = df[col_name].values.astype("datetime64[ns]").view(np.int64)
+            df[col_name] = pd.to_datetime(epochs, utc=True).tz_convert(tz)
 
 
-def select_res_to_df(query):
+def get_select_statement(query, fetch_size=SELECT_FETCH_SIZE):
     """
-    process a select query and returns a pandas DataFrame
-    with the result of the query
+    Get the statement of a select query, fetched by pages of 'fetch_size' rows
     """
+    # select queries are idempotent : they can be speculatively executed
+    return cassandra.query.SimpleStatement(
+        query,
+        fetch_size=fetch_size,
+        is_idempotent=True
+    )
 
-    SESSION.row_factory = pandas_factory
-    SESSION.default_fetch_size = None
 
-    rslt = SESSION.execute(query, timeout=None)
-    df = rslt._current_rows
+def get_pages(rslt):
+    """
+    yield the pages of a result set, 1 pandas DataFrame per page
+    """
+    while True:
+        yield rslt._current_rows
+        if not rslt.has_more_pages:
+            break
+        rslt.fetch_next_page()
 
-    return df
 
+def select_res_chunks(query, fetch_size=SELECT_FETCH_SIZE):
+    """
+    process a select query page by page (of 'fetch_size' rows) and
+    yield a pandas DataFrame per page
+    """
+    statement = get_select_statement(query, fetch_size)
+    rslt = get_session().execute(statement, execution_profile=READ_PROFILE)
 
-def select_query(
+    return get_pages(rslt)
+
+
+def select_res_concurrent(queries, concurrency=READ_CONCURRENCY, tz='CET'):
+    """
+    process select queries concurrently, with at most 'concurrency' queries
+    in flight at the same time
+    return the list of pandas DataFrames with the result of each query,
+    in the order of the queries
+    """
+    session = get_session()
+    results = [None] * len(queries)
+    in_flight = collections.deque()  # (query position, response future)
+
+    def collect(i, future):
+        res_df = concat_chunks(get_pages(future.result()))
+        if len(res_df) > 0:
+            convert_columns_timezones(res_df, tz)
+        results[i] = res_df
+
+    for i, query in enumerate(queries):
+        if len(in_flight) >= concurrency:
+            collect(*in_flight.popleft())
+        logging.debug("===> async select query : " + query)
+        in_flight.append((
+            i,
+            session.execute_async(get_select_statement(query), execution_profile=READ_PROFILE)
+        ))
+
+    while len(in_flight) > 0:
+        collect(*in_flight.popleft())
+
+    return results
+
+
+def concat_chunks(chunks, max_bytes=SELECT_MAX_BYTES):
+    """
+    Concatenate DataFrame chunks into 1 DataFrame
+    raise a MemoryError as soon as the estimated memory of the chunks
+    exceeds 'max_bytes' (None = no limit)
+    """
+    res = []
+    empty = pd.DataFrame()
+    nb_bytes = 0
+    for chunk in chunks:
+        if len(chunk) == 0:
+            # keep the columns in case of empty result
+            empty = chunk
+            continue
+        nb_bytes += chunk.memory_usage(index=False).sum()
+        if max_bytes is not None and nb_bytes > max_bytes:
+            raise MemoryError("Select query result exceeds {} bytes".format(max_bytes))
+        res.append(chunk)
+
+    if len(res) == 0:
+        return empty
+    elif len(res) == 1:
+        return res[0]
+    return pd.concat(res, ignore_index=True)
+
+
+def select_res_to_df(query, fetch_size=SELECT_FETCH_SIZE, max_bytes=SELECT_MAX_BYTES):
+    """
+    process a select query and returns a pandas DataFrame
+    with the result of the query
+    """
+    return concat_chunks(select_res_chunks(query, fetch_size), max_bytes)
+
+
+def get_select_query(
         keyspace,
         table_name,
         columns,
         where_clause,
         limit=None,
         allow_filtering=True,
-        distinct=False,
-        tz='CET'
+        distinct=False
 ):
     """
     columns = * or a list of columns
@@ -285,13 +777,113 @@ def select_query(
     query += "{} ".format(limit)
     query += "{};".format(allow_filtering)
 
+    return query
+
+
+def select_query_chunks(
+        keyspace,
+        table_name,
+        columns,
+        where_clause,
+        limit=None,
+        allow_filtering=True,
+        distinct=False,
+        tz='CET',
+        fetch_size=SELECT_FETCH_SIZE
+):
+    """
+    Streaming variant of 'select_query' : yield the result page by page,
+    1 pandas DataFrame of at most 'fetch_size' rows per page
+    """
+    query = get_select_query(
+        keyspace, table_name, columns, where_clause, limit, allow_filtering, distinct
+    )
     logging.debug("===> select query : " + query)
-    res_df = select_res_to_df(query)
-    if len(res_df) > 0:
-        # remark: the date column in tables is in CET timezone
-        convert_columns_timezones(res_df, tz)
+    for chunk in select_res_chunks(query, fetch_size):
+        if len(chunk) > 0:
+            # remark: the date column in tables is in CET timezone
+            convert_columns_timezones(chunk, tz)
+        yield chunk
 
-    return res_df
+
+def select_query(
+        keyspace,
+        table_name,
+        columns,
+        where_clause,
+        limit=None,
+        allow_filtering=True,
+        distinct=False,
+        tz='CET',
+        fetch_size=SELECT_FETCH_SIZE,
+        max_bytes=SELECT_MAX_BYTES
+):
+    """
+    columns = * or a list of columns
+    The result is fetched by pages of 'fetch_size' rows, and its memory
+    is limited to 'max_bytes' (see 'concat_chunks').
+
+    command : SELECT <distinct> <columns> FROM <keyspace>.<table_name>
+                WHERE <where_clause> <LIMIT> <ALLOW FILTERING>;
+    """
+    chunks = select_query_chunks(
+        keyspace,
+        table_name,
+        columns,
+        where_clause,
+        limit,
+        allow_filtering,
+        distinct,
+        tz,
+        fetch_size
+    )
+
+    return concat_chunks(chunks, max_bytes)
+
+
+def select_range(
+        keyspace,
+        table_name,
+        columns,
+        key_column,
+        keys,
+        dates,
+        limit=None,
+        tz='CET'
+):
+    """
+    Range read : get the rows of several partitions (key_column = each of 'keys')
+    for several days (day = each of 'dates'). 1 query per (key, day), queries are
+    processed concurrently (see 'select_res_concurrent').
+
+    return a dictionary with
+    key : date, value : DataFrame with the rows of all the keys for this day,
+    in the order of 'keys'
+    """
+    queries = []
+    for date in dates:
+        for key in keys:
+            queries.append(get_select_query(
+                keyspace,
+                table_name,
+                columns,
+                "{} = '{}' and day = '{}'".format(key_column, key, date),
+                limit,
+                allow_filtering=False
+            ))
+    results = select_res_concurrent(queries, tz=tz)
+
+    by_date = {}
+    for i, date in enumerate(dates):
+        date_results = results[i * len(keys):(i + 1) * len(keys)]
+        non_empty = [res_df for res_df in date_results if len(res_df) > 0]
+        if len(non_empty) > 0:
+            # keep the index of each query result, like the result of 1 query per key
+            by_date[date] = pd.concat(non_empty)
+        else:
+            by_date[date] = date_results[0] if len(date_results) > 0 else pd.DataFrame()
+
+    return by_date
 
 
 def groupby_query(
@@ -0,0 +1,127 @@
+__title__ = "raw_missing"
+__version__ = "2.0.0"
+__author__ = "Alexandre Heneffe, Guillaume Levasseur, and Brice Petit"
+__license__ = "MIT"
+
+
+"""
+Store of the gaps (intervals of missing raw data) of each sensor, backed by
+the raw missing table. The gaps are loaded once, then updated incrementally :
+only the rows that changed are upserted or deleted.
+"""
+
+
+# local sources
+from constants import (
+    CASSANDRA_KEYSPACE,
+    TBL_RAW_MISSING
+)
+
+import py_to_cassandra as ptc
+
+
+KEY_COLUMNS = ["sensor_id", "config_id", "start_ts"]
+COLUMNS = KEY_COLUMNS + ["end_ts"]
+PARTITION_KEY = ["sensor_id", "config_id"]
+
+
+def cut_gap(gap, start_ts, end_ts):
+    """
+    Remove the interval [start_ts, end_ts] from a gap
+    gap : (config_id, start_ts, end_ts)
+    return the list of the remaining parts of the gap (0, 1 or 2 gaps)
+    """
+    config_id, gap_start, gap_end = gap
+    if gap_end <= start_ts or gap_start >= end_ts:
+        return [gap]
+
+    parts = []
+    if gap_start < start_ts:
+        parts.append((config_id, gap_start, start_ts))
+    if gap_end > end_ts:
+        parts.append((config_id, end_ts, gap_end))
+    return parts
+
+
+def merge_gaps(gaps):
+    """
+    Merge the overlapping gaps. A merged gap keeps the config id of its earliest part.
+    return the list of gaps, sorted by start timestamp
+    """
+    merged = []
+    for config_id, gap_start, gap_end in sorted(gaps, key=lambda gap: gap[1]):
+        if len(merged) > 0 and gap_start <= merged[-1][2]:
+            last = merged[-1]
+            merged[-1] = (last[0], last[1], max(last[2], gap_end))
+        else:
+            merged.append((config_id, gap_start, gap_end))
+    return merged
+
+
+class RawMissing:
+    def __init__(self, gaps):
+        # key : sensor id, value : list of (config_id, start_ts, end_ts) sorted by start_ts
+        self.gaps = gaps
+
+    def get_sensor_gaps(self, sid):
+        return self.gaps.get(sid, [])
+
+    def get_first_start(self, sid):
+        """
+        Get the start timestamp of the first gap of a sensor, None if no gap
+        """
+        gaps = self.get_sensor_gaps(sid)
+        return gaps[0][1] if len(gaps) > 0 else None
+
+    def update(self, sensors_ids, config_id, start_ts, end_ts, new_gaps, writer):
+        """
+        The data of the sensors has been synchronized between start_ts and end_ts :
+        their known gaps are closed in this interval, and replaced by the new gaps.
+        - new_gaps : dict with key : sensor id, value : list of (start_ts, end_ts)
+        The changed rows of the raw missing table are fed into the writer : in the sync,
+        a ptc.PendingWrites, written once the raw rows are (see 'sync_flukso.flush_writes')
+        """
+        deleted = []
+        upserted = []
+        for sid in sensors_ids:
+            old_gaps = self.get_sensor_gaps(sid)
+            gaps = [part for gap in old_gaps for part in cut_gap(gap, start_ts, end_ts)]
+            gaps = merge_gaps(gaps + [(config_id, s, e) for s, e in new_gaps.get(sid, [])])
+
+            old_rows = {(c, s): e for c, s, e in old_gaps}
+            rows = {(c, s): e for c, s, e in gaps}
+            deleted += [(sid, c, s) for c, s in old_rows if (c, s) not in rows]
+            upserted += [
+                (sid, c, s, e) for (c, s), e in rows.items() if old_rows.get((c, s)) != e
+            ]
+
+            if len(gaps) > 0:
+                self.gaps[sid] = gaps
+            else:
+                self.gaps.pop(sid, None)
+
+        writer.delete(CASSANDRA_KEYSPACE, TBL_RAW_MISSING, KEY_COLUMNS, deleted, PARTITION_KEY)
+        writer.insert(CASSANDRA_KEYSPACE, TBL_RAW_MISSING, COLUMNS, upserted, PARTITION_KEY)
+
+
+def get_raw_missing():
+    """
+    Load the raw missing table, in 1 query
+    return a RawMissing store
+    """
+    missing_df = ptc.select_query(
+        CASSANDRA_KEYSPACE,
+        TBL_RAW_MISSING,
+        COLUMNS,
+        where_clause="",
+        limit=None,
+        allow_filtering=False
+    )
+
+    gaps = {}
+    for sid, config_id, start_ts, end_ts in missing_df.itertuples(index=False):
+        gaps.setdefault(sid, []).append((config_id, start_ts, end_ts))
+
+    return RawMissing({
+        sid: sorted(sensor_gaps, key=lambda gap: gap[1]) for sid, sensor_gaps in gaps.items()
+    })
@@ -4,12 +4,27 @@ __author__ = "Alexandre Heneffe, and Brice Petit"
 __license__ = "MIT"
 
 
+from collections import namedtuple
+
+
+# configuration of 1 home, built once per Configuration
+# - sensors_ids, tokens, flukso_ids : lists, in the order of the config rows
+# - net, con, pro : arrays of coefficients, same order
+# - config_df : the rows of the home in the whole config
+HomeConfig = namedtuple(
+    "HomeConfig",
+    ["sensors_ids", "tokens", "flukso_ids", "net", "con", "pro", "config_df"]
+)
+
+
 class Configuration:
     def __init__(self, config_id, sconfig_df):
         self.config_id = config_id              # config insertion date
         self.sconfig_df = sconfig_df            # dataframe with the whole config
 
-        self.ids = self.get_home_sensors()      # all home ids (installation ids)
+        self.homes = self.build_homes()         # key : home id, value : HomeConfig
+        # all home ids (installation ids) with their sensors ids
+        self.ids = {hid: home.sensors_ids for hid, home in self.homes.items()}
 
     def __str__(self):
         """
@@ -45,6 +60,36 @@ class Configuration:
         """
         return self.sconfig_df
 
+    def build_homes(self):
+        """
+        Split the config by home, once
+        return a dictionary with key : home id, value : HomeConfig
+        """
+        # 'sensor_token' when loaded from cassandra, 'token' from an excel file
+        token_col = "sensor_token" if "sensor_token" in self.sconfig_df.columns else "token"
+        homes = {}
+        for hid, home_df in self.sconfig_df.groupby("home_id"):
+            homes[hid] = HomeConfig(
+                sensors_ids=list(home_df.index),
+                tokens=list(home_df[token_col]),
+                flukso_ids=list(home_df["flukso_id"]),
+                net=home_df["net"].values.astype(float),
+                con=home_df["con"].values.astype(float),
+                pro=home_df["pro"].values.astype(float),
+                config_df=home_df
+            )
+
+        return homes
+
+    def get_home_ids(self):
+        return list(self.homes.keys())
+
+    def get_home(self, hid):
+        """
+        Getter for the HomeConfig of the home hid.
+        """
+        return self.homes[hid]
+
     def get_home_config(self, hid):
         """
         Getter for the configuration of the home hid.
@@ -54,18 +99,15 @@ class Configuration:
         :return:    Return a subset of the configuration with only
                     the configuration of the home hid.
         """
-        return self.sconfig_df[self.sconfig_df['home_id'] == hid]
+        return self.homes[hid].config_df
 
     def get_home_sensors(self):
         """
         return a dictionary with
         key : home id, value : list of sensor ids
+        (a copy, can be modified)
         """
-        ids = {}
-        for hid, home in self.sconfig_df.groupby("home_id"):
-            ids[hid] = list(home.index)
-
-        return ids
+        return {hid: list(sids) for hid, sids in self.ids.items()}
 
     def get_ids(self):
         return self.ids
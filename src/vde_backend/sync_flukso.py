@@ -13,6 +13,10 @@ Script to fetch Fluksometer data using the tmpo protocol and
 
 # standard library
 from datetime import timedelta
+import itertools
+import logging.handlers
+import multiprocessing
+import multiprocessing.util
 import time
 import argparse
 import sys
@@ -29,11 +33,14 @@ from utils import (
     get_last_registered_config,
     get_prog_dir,
     get_time_spent,
+    get_days,
+    get_day_slices,
     is_earlier,
     set_init_seconds,
     read_sensor_info,
-    energy2power,
-    get_local_timestamps_index,
+    get_energy_segments,
+    segments_energy2power,
+    index_to_epochs_ns,
     time_range
 )
 
@@ -49,18 +56,29 @@ from constants import (
     CASSANDRA_KEYSPACE,
     FROM_FIRST_TS,
     GAP_THRESHOLD,
-    INSERTS_PER_BATCH,
     LIMIT_TIMING_RAW,
+    RECORD_ALL_GAPS,
+    SYNC_QUEUE_SIZE,
+    SYNC_SPAN,
+    SYNC_STAGES,
+    SYNC_STAGE_WORKERS,
+    SYNC_WORKERS,
     TBL_RAW,
     FREQ,
     TBL_RAW_MISSING,
+    TBL_RAW_LAST_TS,
     TMPO_FILE,
     TBL_POWER
 )
 
 
 import py_to_cassandra as ptc
-from compute_power import save_home_power_data_to_cassandra, get_consumption_production_df
+from raw_missing import get_raw_missing
+from compute_power import save_home_power_data_to_cassandra, get_consumption_production_series
+from home_series import HomeSeries
+from pipeline import Pipeline, Stage, show_pipeline_stats
+from tmpo_reader import TmpoReader
+from tmpo_sync import get_first_timestamp, sync_sensors
 
 # security warning & Future warning
 warnings.simplefilter('ignore', urllib3.exceptions.SecurityWarning)
@@ -144,9 +162,47 @@ def create_raw_missing_table(table_name):
     )
 
 
+def create_raw_last_ts_table(table_name):
+    """
+    Raw last ts table contains, for each sensor, its last timestamp saved in the
+    raw table (= watermark). Updated at each raw data insertion.
+    """
+
+    cols = [
+        "sensor_id TEXT",
+        "last_ts TIMESTAMP"
+    ]
+
+    ptc.create_table(
+        CASSANDRA_KEYSPACE,
+        table_name,
+        cols,
+        ["sensor_id"],
+        [],
+        {}
+    )
+
+
 # ====================================================================================
 
 
+def get_last_timestamps():
+    """
+    get the last registered timestamp of all the sensors, in 1 query
+    return a dict with key : sensor id, value : last timestamp (CET timezone)
+    """
+    last_ts_df = ptc.select_query(
+        CASSANDRA_KEYSPACE,
+        TBL_RAW_LAST_TS,
+        ["sensor_id", "last_ts"],
+        where_clause="",
+        limit=None,
+        allow_filtering=False
+    )
+
+    return dict(zip(last_ts_df["sensor_id"], last_ts_df["last_ts"]))
+
+
 def get_last_registered_timestamp(table_name, sensor_id):
     """
     get the last registered timestamp of the raw table
@@ -187,14 +243,15 @@ def get_last_registered_timestamp(table_name, sensor_id):
 
 def get_initial_timestamp(tmpo_session, sid, now):
     """
-    get the first ever registered timestamp for a sensor using tmpo Session
+    get the first ever registered timestamp for a sensor using its tmpo watermark
+    (see 'tmpo_sync.get_first_timestamp')
     if no such timestamp (None), return an arbitrary timing (ex: since 4min)
 
     return a timestamp in local timezone (CET)
     """
     initial_ts = now if FROM_FIRST_TS is None else (now - pd.Timedelta(FROM_FIRST_TS))
     if PROD:
-        initial_ts_tmpo = tmpo_session.first_timestamp(sid)
+        initial_ts_tmpo = get_first_timestamp(tmpo_session, sid)
 
         if initial_ts_tmpo is not None:
             initial_ts = initial_ts_tmpo.tz_convert("CET")
@@ -202,27 +259,28 @@ def get_initial_timestamp(tmpo_session, sid, now):
     return initial_ts
 
 
-def get_sensor_timings(tmpo_session, missing_data, sid, now):
+def get_sensor_timings(tmpo_session, raw_missing, last_timestamps, sid, now):
     """
     For each sensor, we get start timing, forming the interval of time we have to
     query to tmpo
     - The start timing is either based on the missing data table, or the initial timestamp
     of the sensor if no missing data registered, or simply the default timing (the last
     registered timestamp in raw data table)
+    - last_timestamps : last registered timestamp of each sensor (see 'get_last_timestamps').
+    The raw table is only scanned for the sensors without one.
 
     return a starting timestamp with CET timezone
         or None if no starting timestamp
     """
-    if sid in missing_data['sensor_id']:  # if there is missing data for this sensor
+    first_missing_ts = raw_missing.get_first_start(sid)
+    if first_missing_ts is not None:  # if there is missing data for this sensor
         # CET timezone (minus a certain offset to avoid losing first ts)
-        sensor_start_ts = (
-            missing_data
-            .groupby('sensor_id')
-            .get_group(sid)["start_ts"]
-            - timedelta(seconds=FREQ[0])
-        )  # sensor start timing = missing data first timestamp
+        # sensor start timing = missing data first timestamp
+        sensor_start_ts = first_missing_ts - timedelta(seconds=FREQ[0])
     else:  # if no missing data for this sensor
-        default_timing = get_last_registered_timestamp(TBL_RAW, sid)  # None or tz-naive CET
+        default_timing = last_timestamps.get(sid)
+        if default_timing is None:
+            default_timing = get_last_registered_timestamp(TBL_RAW, sid)  # None or CET
         if default_timing is None:  # if no raw data registered for this sensor yet
             # we take its first tmpo timestamp
             sensor_start_ts = get_initial_timestamp(tmpo_session, sid, now)
@@ -232,7 +290,9 @@ def get_sensor_timings(tmpo_session, missing_data, sid, now):
     return sensor_start_ts
 
 
-def compute_timings(tmpo_session, timings, home_id, sensors_ids, missing_data, now):
+def compute_timings(
+    tmpo_session, timings, home_id, sensors_ids, raw_missing, last_timestamps, now
+):
     """
     Function to compute timings. By timings we mean that moments where we don't have data.
 
@@ -242,7 +302,8 @@ def compute_timings(tmpo_session, timings, home_id, sensors_ids, missing_data, n
     :param timings:         Timings -> period where there are missing data.
     :param home_id:         Home id.
     :param sensors_ids:     List of all sensors for the home_id.
-    :param missing_data:    Dataframe containing missing data.
+    :param raw_missing:     Missing data store (RawMissing).
+    :param last_timestamps: Last registered timestamp of each sensor.
     :param now:             Current timestamp.
 
     :return:                Return a dictionary with periods where there are missing data.
@@ -250,24 +311,17 @@ def compute_timings(tmpo_session, timings, home_id, sensors_ids, missing_data, n
     # for each sensor of this home
     for sid in sensors_ids:
         # Get the first moment where we have missing data
-        sensor_start_ts = get_sensor_timings(tmpo_session, missing_data, sid, now)
-
-        # Sometimes, get_sensor_timing will return a list. So, if it is not a list,
-        # we create a list.
-        if type(sensor_start_ts) is not pd.Series:
-            sensor_start_ts = [sensor_start_ts]
-        # For each potential ts.
-        for ts in sensor_start_ts:
-            logging.debug(f"sensors start ts : {ts}")
-            # if 'ts' is older (in the past) than the current start_ts
-            if is_earlier(ts, timings[home_id]["start_ts"]):
-                timings[home_id]["start_ts"] = ts
-
-            # ensures a CET timezone
-            if str(ts.tz) == "None":
-                ts = ts.tz_localize("CET")
-            # CET
-            timings[home_id]["sensors"][sid] = set_init_seconds(ts)
+        ts = get_sensor_timings(tmpo_session, raw_missing, last_timestamps, sid, now)
+        logging.debug(f"sensors start ts : {ts}")
+        # if 'ts' is older (in the past) than the current start_ts
+        if is_earlier(ts, timings[home_id]["start_ts"]):
+            timings[home_id]["start_ts"] = ts
+
+        # ensures a CET timezone
+        if str(ts.tz) == "None":
+            ts = ts.tz_localize("CET")
+        # CET
+        timings[home_id]["sensors"][sid] = set_init_seconds(ts)
 
     # no data to recover from this home
     if timings[home_id]["start_ts"] is now:
@@ -275,7 +329,7 @@ def compute_timings(tmpo_session, timings, home_id, sensors_ids, missing_data, n
     return timings
 
 
-def get_timings(tmpo_session, config, missing_data, now):
+def get_timings(tmpo_session, config, raw_missing, last_timestamps, now):
     """
     For each home, get the start timing for the query based on the missing data table
     (containing for each sensor the first timestamp with missing data from the previous query)
@@ -293,24 +347,21 @@ def get_timings(tmpo_session, config, missing_data, now):
             timings[home_id] = {
                 "start_ts": now,
                 "end_ts": now - pd.Timedelta(minutes=10),
-                "sensors": {}
+                "sensors": {},
+                "last_ts": {sid: last_timestamps.get(sid) for sid in sensors_ids}
             }
 
             timings = compute_timings(
-                tmpo_session, timings, home_id, sensors_ids, missing_data, now
+                tmpo_session, timings, home_id, sensors_ids, raw_missing, last_timestamps, now
             )
 
-        # truncate existing rows in Raw missing table
-        ptc.delete_rows(CASSANDRA_KEYSPACE, TBL_RAW_MISSING)
-        logging.debug("Missing raw table deleted")
-
     except Exception:
         logging.critical("Exception occured in 'get_timings' : ", exc_info=True)
 
     return timings
 
 
-def set_custom_timings(config, timings, custom_timings):
+def set_custom_timings(config, timings, last_timestamps, custom_timings):
     """
     Set custom start timing and custom end timing for each home, and each sensor
     - Same custom timings for each home.
@@ -320,7 +371,8 @@ def set_custom_timings(config, timings, custom_timings):
             timings[home_id] = {
                 "start_ts": custom_timings["start_ts"],
                 "end_ts": custom_timings["end_ts"],
-                "sensors": {}
+                "sensors": {},
+                "last_ts": {sid: last_timestamps.get(sid) for sid in sensors_ids}
             }
             for sid in sensors_ids:
                 # CET
@@ -330,19 +382,20 @@ def set_custom_timings(config, timings, custom_timings):
         logging.critical("Exception occured in 'set_custom_timings' : ", exc_info=True)
 
 
-def process_timings(tmpo_session, config, missing_data, now, custom_timings):
+def process_timings(tmpo_session, config, raw_missing, last_timestamps, now, custom_timings):
     """
     Get the timings for each home
     Timings are either custom or determined by the current database state.
     """
     timings = {}
     if (len(custom_timings) > 0):
-        set_custom_timings(config, timings, custom_timings)
+        set_custom_timings(config, timings, last_timestamps, custom_timings)
     else:
         timings = get_timings(
             tmpo_session,
             config,
-            missing_data,
+            raw_missing,
+            last_timestamps,
             now
         )
 
@@ -352,46 +405,61 @@ def process_timings(tmpo_session, config, missing_data, now, custom_timings):
 # ====================================================================================
 
 
-def test_session(sensors_config):
+def get_tmpo_path():
     """
-    test each sensor and see if tmpo accepts or refuses the sensor when
-    syncing
+    Get the directory of the tmpo database
     """
     path = TMPO_FILE
     if not path:
         path = get_prog_dir()
+    return path
 
-    for sid, row in sensors_config.get_sensors_config().iterrows():
-        try:
-            logging.debug("{}, {}".format(sid, row["sensor_token"]))
-            tmpo_session = tmpo.Session(path)
-            tmpo_session.add(sid, row["sensor_token"])
-            tmpo_session.sync()
-            logging.debug("=> OK")
-        except Exception:
-            logging.warning("=> NOT OK")
-            continue
+
+def get_sensors_tokens(config):
+    """
+    Get the (sensor id, token) of all the sensors of the configuration
+    """
+    for hid in config.get_home_ids():
+        home = config.get_home(hid)
+        yield from zip(home.sensors_ids, home.tokens)
 
 
-def get_tmpo_session(config):
+def test_session(sensors_config):
+    """
+    test each sensor (quarantined or synced recently or not) and see if tmpo accepts
+    or refuses the sensor when syncing
+    """
+    tmpo_session = tmpo.Session(get_tmpo_path())
+    sensors = list(get_sensors_tokens(sensors_config))
+    reports = sync_sensors(
+        tmpo_session, sensors, use_quarantine=False, use_sync_interval=False
+    )
+    for report in reports:
+        if report["ok"]:
+            logging.debug("{} => OK".format(report["sid"]))
+        else:
+            logging.warning("{} => NOT OK : {}".format(report["sid"], report["error"]))
+
+
+def get_tmpo_session(config, full_resync=False):
     """
     Get tmpo (via api) session with all the sensors in it
+    - full_resync : True to request all the blocks of all the sensors
     """
-    path = TMPO_FILE
-    if not path:
-        path = get_prog_dir()
+    path = get_tmpo_path()
     logging.info("tmpo path : " + path)
 
     tmpo_session = tmpo.Session(path)
-    for sid, row in config.get_sensors_config().iterrows():
-        tmpo_session.add(sid, row["sensor_token"])
 
     logging.info("> tmpo synchronization...")
     try:
-        tmpo_session.sync()
+        # sensor by sensor : an invalid sensor does not block the others
+        sync_sensors(
+            tmpo_session, list(get_sensors_tokens(config)), full_resync=full_resync
+        )
     except Exception:
         logging.warning("Exception occured in tmpo sync: ", exc_info=True)
-        logging.warning("> tmpo sql file needs to be reset, or some sensors are invalid.")
+        logging.warning("> tmpo sql file needs to be reset.")
     logging.info("> tmpo synchronization : OK")
 
     return tmpo_session
@@ -418,79 +486,126 @@ def get_flukso_data(sensor_file, path=""):
 # ====================================================================================
 
 
-def save_home_missing_data(config, to_timing, hid, incomplete_raw_df):
+def get_missing_intervals(missing, index, columns, to_timing):
     """
-    Save the first timestamp with no data (nan values) for each sensors of the home
+    Get every interval of missing data of each column
+    - missing : boolean matrix (True = missing value), 1 row per timestamp of 'index'
+    1 interval = (first missing timestamp, first timestamp with data after it
+    or 'to_timing' if no data after it)
+    return a dict with key : column, value : list of intervals
     """
-    saved_sensors = {}
-    try:
-        config_id = config.get_config_id()
+    # +1 where a run of missing values starts, -1 after its end (1 row per column)
+    padding = np.zeros((missing.shape[1], 1), dtype=np.int8)
+    edges = np.diff(np.hstack([padding, missing.T.astype(np.int8), padding]), axis=1)
+    # sorted by column, then by timestamp
+    cols, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
 
-        col_names = ["sensor_id", "config_id", "start_ts", "end_ts"]
+    bounds = index.append(pd.DatetimeIndex([to_timing]))
+    intervals = {}
+    for col, start, end in zip(cols, starts, ends):
+        intervals.setdefault(columns[col], []).append((bounds[start], bounds[end]))
+    return intervals
 
-        if len(incomplete_raw_df) > 0:
-            sensors_ids = incomplete_raw_df.columns
-            for sid in sensors_ids:
-                # if no missing data saved for this sensor yet
-                if saved_sensors.get(sid, None) is None:
-                    # if the column contains null
-                    if incomplete_raw_df[sid].isnull().values.any():
-                        for i, timestamp in enumerate(incomplete_raw_df.index):
-                            # if valid timestamp
-                            # X days from now max
-                            if (to_timing - timestamp).days < LIMIT_TIMING_RAW:
-                                if np.isnan(incomplete_raw_df[sid][i]):
-                                    values = [sid, config_id, timestamp, to_timing]
-                                    ptc.insert(
-                                        CASSANDRA_KEYSPACE, TBL_RAW_MISSING,
-                                        col_names, values
-                                    )
-                                    # mark that this sensor has missing data
-                                    saved_sensors[sid] = True
-                                    # as soon as we find the first ts with null value,
-                                    # we go to next sensor
-                                    break
+
+def save_home_missing_data(to_timing, hid, energy, home_gaps):
+    """
+    Save the gaps (nan values) of each sensor of the home in home_gaps
+    (dict with key : sensor id, value : list of (start_ts, end_ts)).
+    - by default, 1 gap per sensor : from its first timestamp with no data to 'to_timing'
+    - if RECORD_ALL_GAPS : every interval of missing data of the sensor
+    Only the timestamps less than LIMIT_TIMING_RAW days before 'to_timing' are kept.
+    The gaps of the home are written in the raw missing table at the end of its sync.
+    """
+    try:
+        # X days from now max
+        recent = energy.epochs > (to_timing - pd.Timedelta(days=LIMIT_TIMING_RAW)).value
+        missing = energy.isna()[recent]
+        index = energy.get_index()[recent]
+        if len(index) == 0:
+            return
+
+        if RECORD_ALL_GAPS:
+            gaps = get_missing_intervals(missing, index, energy.columns, to_timing)
+        else:
+            # first missing timestamp of each sensor with missing data
+            has_missing = missing.any(axis=0)
+            first_missing = index[missing.argmax(axis=0)[has_missing]]
+            sids = np.array(energy.columns, dtype=object)[has_missing]
+            gaps = {sid: [(ts, to_timing)] for sid, ts in zip(sids, first_missing)}
+
+        for sid, sensor_gaps in gaps.items():
+            home_gaps.setdefault(sid, []).extend(sensor_gaps)
     except Exception:
         logging.critical(
             "Exception occured in 'save_home_missing_data' : {} ".format(hid), exc_info=True
         )
 
 
-def save_home_raw_data(hid, raw_df, config, timings):
+def get_raw_columns(raw, sensors_start):
+    """
+    Convert the raw HomeSeries (1 column = 1 sensor) to long format columns,
+    keeping only the timestamps later than the start timing of each sensor.
+    - sensors_start : dict with key : sensor id, value : start timing
+        (None to skip the sensor)
+    return 3 arrays : sensor ids, row positions in raw, power values
+    """
+    cols = [i for i, sid in enumerate(raw.columns) if sensors_start.get(sid) is not None]
+    sids = [raw.columns[i] for i in cols]
+    starts = np.array([sensors_start[sid].value for sid in sids], dtype=np.int64)
+    # 1 cell = 1 (timestamp, sensor) : True if the timestamp > the sensor's start timing
+    mask = raw.epochs[:, np.newaxis] > starts[np.newaxis, :]
+    positions, sensors = np.nonzero(mask)
+    powers = raw.values[:, cols][positions, sensors]
+
+    return np.array(sids, dtype=object)[sensors], positions, powers
+
+
+def save_last_timestamps(last_timestamps, sids, epochs_ms, writer):
+    """
+    Update the last registered timestamp of the sensors (raw last ts table)
+    with the timestamps of newly saved raw rows, only if they are more recent.
+    - last_timestamps : dict with key : sensor id, value : last timestamp or None.
+        Updated in place.
+    - sids, epochs_ms : sensor id and timestamp (epoch in milliseconds) of each row
+    """
+    rows = []
+    for sid, last_ms in pd.Series(epochs_ms).groupby(sids).max().items():
+        last_ts = last_timestamps.get(sid)
+        if last_ts is None or last_ms > last_ts.value // 10**6:
+            last_timestamps[sid] = pd.Timestamp(last_ms, unit="ms", tz="UTC").tz_convert("CET")
+            rows.append((sid, int(last_ms)))
+
+    writer.insert(CASSANDRA_KEYSPACE, TBL_RAW_LAST_TS, ["sensor_id", "last_ts"], rows)
+
+
+def save_home_raw_data(hid, raw, config, timings, writer, deferred):
     """
     Save raw flukso flukso data to Cassandra table
     Save per sensor : 1 row = 1 sensor + 1 timestamp + 1 power value
-        home_df : timestamp, sensor_id1, sensor_id2, sensor_id3 ... sensor_idN
+        raw : HomeSeries, columns : sensor_id1, sensor_id2, sensor_id3 ... sensor_idN
+    The rows are fed into the writer (ptc.AsyncWriter). The new last registered
+    timestamp of the sensors is kept in 'deferred' (ptc.PendingWrites) : it is only
+    written once the raw rows are (see 'flush_writes').
     """
     try:
         insertion_time = pd.Timestamp.now(tz="CET")
         config_id = config.get_config_id()
 
-        # add date column
-        raw_df['date'] = raw_df.apply(lambda row: str(row.name.date()), axis=1)
-        by_day_df = raw_df.groupby("date")  # group by date
-
+        sids, positions, powers = get_raw_columns(raw, timings[hid]["sensors"])
+        # timestamps are bound as epochs in milliseconds
+        epochs_ms = raw.epochs[positions] // 10**6
+        rows = zip(
+            sids.tolist(),
+            get_days(raw.get_index())[positions].tolist(),
+            epochs_ms.tolist(),
+            itertools.repeat(insertion_time),
+            itertools.repeat(config_id),
+            powers.tolist()
+        )
         col_names = ["sensor_id", "day", "ts", "insertion_time", "config_id", "power"]
-        for date, date_rows in by_day_df:  # loop through each group (each date group)
-
-            for sid in date_rows:  # loop through each column, 1 column = 1 sensor
-                if sid == "date" or timings[hid]["sensors"][sid] is None:
-                    continue
-                insert_queries = ""
-                for i, timestamp in enumerate(date_rows[sid].index):
-                    # if the timestamp > the sensor's defined start timing
-                    if is_earlier(timings[hid]["sensors"][sid], timestamp):
-                        power = date_rows[sid][i]
-                        values = [sid, date, timestamp, insertion_time, config_id, power]
-                        insert_queries += ptc.get_insert_query(
-                            CASSANDRA_KEYSPACE, TBL_RAW, col_names, values
-                        )
-
-                        if (i + 1) % INSERTS_PER_BATCH == 0:
-                            ptc.batch_insert(insert_queries)
-                            insert_queries = ""
-
-                ptc.batch_insert(insert_queries)
+        writer.insert(CASSANDRA_KEYSPACE, TBL_RAW, col_names, rows, ["sensor_id", "day"])
+        save_last_timestamps(timings[hid]["last_ts"], sids, epochs_ms, deferred)
     except Exception:
         logging.critical("Exception occured in 'save_home_raw_data' : ", exc_info=True)
 
@@ -543,42 +658,44 @@ def get_intermediate_timings(start_ts, end_ts):
 
 
 def save_data_threads(
-    hid, raw_df, incomplete_raw_df, cons_prod_df,
-    config, timings, now, custom
+    hid, raw, energy, nb_incomplete, cons_prod,
+    config, timings, now, custom, home_gaps, writer, deferred
 ):
     """
     Threads to save data to different Cassandra tables
     -> raw data in raw table
-    -> raw missing data in raw_missing table
+    -> raw missing data in home_gaps (see 'save_home_missing_data')
     -> power data in power table
+    Raw and power rows are fed into the asynchronous writer : the threads
+    return as soon as their rows are sent, not when they are written.
     """
 
     threads = []
     # save raw flukso data in cassandra
-    if len(raw_df) > 0:
+    if len(raw) > 0:
         t1 = Thread(
             target=save_home_raw_data,
-            args=(hid, raw_df, config, timings)
+            args=(hid, raw, config, timings, writer, deferred)
         )
         threads.append(t1)
         t1.start()
 
     # in custom mode, no need to save missing data (in the past)
     # and check if there are data
-    if not custom and len(incomplete_raw_df) > 0:
-        # save missing raw data in cassandra
+    if not custom and nb_incomplete > 0:
+        # save missing raw data
         t2 = Thread(
             target=save_home_missing_data,
-            args=(config, now, hid, incomplete_raw_df)
+            args=(now, hid, energy, home_gaps)
         )
         threads.append(t2)
         t2.start()
 
     # save power flukso data in cassandra
-    if len(cons_prod_df) > 0:
+    if len(cons_prod) > 0:
         t3 = Thread(
             target=save_home_power_data_to_cassandra,
-            args=(hid, cons_prod_df, config)
+            args=(hid, cons_prod, config, writer)
         )
         threads.append(t3)
         t3.start()
@@ -588,193 +705,506 @@ def save_data_threads(
         t.join()
 
 
-def find_incomplete_raw_df(energy_df):
-    """
-    From the cumulative energy dataframe,
-    1) fill the gaps in the timestamps with NaN values
-    2) get a dataframe containing all the lines with NaN values (= incomplete rows)
-    """
-    incomplete_raw_df = energy_df[energy_df.isna().any(axis=1)]  # with CET timezones
-    incomplete_raw_df.index = pd.DatetimeIndex(incomplete_raw_df.index, name="time")
-    # convert all timestamps to local timezone (CET)
-    incomplete_raw_df.index = get_local_timestamps_index(incomplete_raw_df)
-    return incomplete_raw_df
-
-
-def generate_raw_df(df):
+def generate_raw_series(energy):
     """
-    The goal of this function is to generate a raw dataframe according to the df
-    that can be a dataframe with consumption values or production values. It will
-    return the generated dataframe.
+    The goal of this function is to generate raw data from the energy series
+    (HomeSeries) of sensors that can be consumption sensors or production sensors.
 
     The main idea of this function is that we don't want to keep a hole of data
     that is above a certain threshold but holes that are under the threshold, we
     want to keep them. We want to fill these small holes.
 
-    :param df:  Dataframe. The dataframe can be a dataframe with consumption values
-                or production values.
-
-    :return:    Return the new created dataframe.
-    """
-    raw_df = pd.DataFrame()
-    # Check if there is a hole of values of a certain threshold of time.
-    if ((df.dropna().index.to_series().diff() > GAP_THRESHOLD).cumsum().sum()) > 0:
-        tmp_res = []
-        # If it is the case, we create a group where we drop all data.
-        group = df.groupby((df.dropna().index.to_series().diff() > GAP_THRESHOLD).cumsum())
-        for chunk_nb, chunk in group:
-            # First, we check the difference between the first time value of the group 0
-            # and the first time value of energy_df. The reason is that the dropna will
-            # drop all na but we want to keep na that are under the threshold and remove
-            # all na that above the threshold. That's also why we consider df and not chunk.
-            if (
-                chunk_nb == 0
-                and chunk.index[0] != df.index[0]
-                and (chunk.index[0] - df.index[0]) <= pd.Timedelta(GAP_THRESHOLD)
-            ):
-                tmp_res.append(energy2power(df[df.index[0]:chunk.index[-1]]))
-            # Same reason as before but with last values.
-            elif (
-                chunk_nb == group.ngroups - 1
-                and chunk.index[-1] != df.index[-1]
-                and (df.index[-1] - chunk.index[-1]) <= pd.Timedelta(GAP_THRESHOLD)
-            ):
-                tmp_res.append(
-                    energy2power(df[chunk.index[0]:df.index[-1]])
-                )
-            # All intermediates states.
-            else:
-                tmp_res.append(energy2power(df[chunk.index[0]:chunk.index[-1]]))
-        # Check if the list is not empty
-        if len(tmp_res) > 0:
-            raw_df = pd.concat(tmp_res)
-    # If it is not the case, we do the way to have the power.
-    else:
-        raw_df = energy2power(df)
-    return raw_df
+    The holes are found once (see 'get_energy_segments'), then the power of all
+    the segments between them is computed in 1 pass (see 'segments_energy2power').
 
+    :param energy:  HomeSeries with cumulative energy values.
 
-def create_flukso_raw_df(energy_df, home_sensors):
+    :return:        Return a HomeSeries with the power values.
     """
-    create a dataframe where the colums are the phases of the Flukso and the rows are the
+    # a row is valid if no sensor has a nan value
+    valid = ~energy.isna().any(axis=1)
+    starts, ends = get_energy_segments(
+        energy.epochs, valid, pd.Timedelta(GAP_THRESHOLD).value
+    )
+    power, rows = segments_energy2power(
+        energy.values.astype(np.float64), energy.epochs, starts, ends
+    )
+    return HomeSeries(energy.epochs[rows], power, energy.columns)
+
+
+def create_flukso_raw_series(energy, home):
+    """
+    create a HomeSeries where the colums are the phases of the Flukso and the rows are the
     data :
-    1 row = 1 timestamp = 1 power value
+    1 row = 1 timestamp = 1 power value (float32)
+    1 column per sensor with a net or pro coefficient, in the order of the config
+    - home : HomeConfig of the home
     """
-    # Separate mains and pv.
-    raw_cons = generate_raw_df(energy_df[home_sensors.loc[home_sensors['net'] != 0].index])
-    raw_prod = generate_raw_df(energy_df[home_sensors.loc[home_sensors['pro'] != 0].index])
+    # Separate mains and pv. A sensor with a net and a pro coefficient is a main.
+    cons_ids = [sid for sid, n in zip(home.sensors_ids, home.net) if n != 0]
+    prod_ids = [
+        sid for sid, n, p in zip(home.sensors_ids, home.net, home.pro) if p != 0 and n == 0
+    ]
+    raw_cons = generate_raw_series(energy.select(cons_ids))
+    raw_prod = generate_raw_series(energy.select(prod_ids))
     # It is missing a column VE in the database and we need it for ECHCOM
-    # raw_ve = generate_raw_df(energy_df[home_sensors.loc[home_sensors['ve'] != 0]])
-    # raw_df = pd.concat([raw_cons, raw_prod, raw_ve], axis=1)
-    raw_df = pd.concat([raw_cons, raw_prod], axis=1)
-    if len(raw_df) > 0:
-        # convert all timestamps to local timezone (CET)
-        local_timestamps = get_local_timestamps_index(raw_df)
-        raw_df.index = local_timestamps
-        if len(local_timestamps) > 1:
-            # drop first row because NaN after conversion
-            raw_df.drop(local_timestamps[0], inplace=True)
+    raw = HomeSeries.concat_columns([raw_cons, raw_prod])
+    raw = raw.select([sid for sid in home.sensors_ids if sid in raw.columns])
+    if len(raw) > 1:
+        # drop first row because NaN after conversion
+        # and round with 1 decimals
+        raw = HomeSeries(raw.epochs[1:], raw.values[1:].round(1), raw.columns)
+    raw.values = raw.values.astype(np.float32)
+    return raw
 
-            raw_df = raw_df.round(1)  # round with 1 decimals
-    return raw_df
 
-
-def get_serie(session, sensor_id, since_timing, to_timing):
+def get_serie(tmpo_reader, sensor_id, since_timing, to_timing):
     """
     # since_timing and to_timing = UTC timezone for tmpo query
+    return 2 arrays : epochs (nanoseconds), energy values
     """
     if to_timing == 0:
-        df = session.series(
-            sensor_id,
-            head=since_timing
-        )
+        epochs, values = tmpo_reader.read(sensor_id, since_timing)
     else:
-        df = session.series(
-            sensor_id,
-            head=since_timing,
-            tail=to_timing
-        )
-    if len(df.index) == 0:
-        df = pd.Series(np.nan, index=time_range(since_timing, to_timing))
-    return df
+        epochs, values = tmpo_reader.read(sensor_id, since_timing, to_timing)
+    if len(epochs) == 0:
+        epochs = index_to_epochs_ns(time_range(since_timing, to_timing))
+        values = np.full(len(epochs), np.nan)
+    return epochs, values
 
 
-def create_energy_df(tmpo_session, home_sensors, start_ts, to_ts):
+def create_energy_series(tmpo_reader, sensors_ids, start_ts, to_ts):
     """
-    Function to create a dataframe with energies for each sensor.
+    Function to create a series with energies for each sensor.
 
-    :param tmpo_session:    Tmpo Session.
-    :param home_sensors:    Dataframe with the config.
+    :param tmpo_reader:     TmpoReader.
+    :param sensors_ids:     Sensors of the home.
     :param start_ts:        Start ts.
     :param to_ts:           End ts.
 
-    :return:                Return an energy dataframe.
+    :return:                Return an energy HomeSeries (float64).
     """
-    sensors = []
-    columns = []
-    for sid, _ in home_sensors.iterrows():
-        sensors.append(get_serie(tmpo_session, sid, start_ts, to_ts))
-        columns.append(sid)
-    energy_df = pd.concat(sensors, axis=1)
-    energy_df.columns = columns
-    return energy_df
+    sensors = [get_serie(tmpo_reader, sid, start_ts, to_ts) for sid in sensors_ids]
+    return HomeSeries.from_arrays(sensors, sensors_ids)
 
 
-def process_homes(tmpo_session, config, timings, now, custom, homes):
+def compute_home_series(hid, energy, home, home_sensors):
     """
-    For each home, we first create the home object containing
-    all the tmpo queries and series computation
-    Then, we save computed data in Cassandra tables.
+    Compute the raw and power data of a home from its energy series
+    return the raw and power HomeSeries, and the nb timestamps with missing energy
     """
-    # for each home
-    for hid, home_sensors in config.get_sensors_config().groupby("home_id"):
+    missing = energy.isna()
+    # If all values are nan, we don't retrieve data
+    if missing.all():
+        raw = HomeSeries.empty()
+        cons_prod = HomeSeries.empty()
+    else:
+        raw = create_flukso_raw_series(energy, home)
+        cons_prod = get_consumption_production_series(raw, home_sensors)
+
+    nb_incomplete = np.count_nonzero(missing.any(axis=1))
+
+    logging.info("     - {} | len raw : {}, len NaN : {}, tot NaN: {}".format(
+        hid,
+        len(raw),
+        nb_incomplete,
+        np.count_nonzero(missing)
+    ))
+
+    return raw, cons_prod, nb_incomplete
+
+
+def process_home(
+    tmpo_reader, hid, home_sensors, config, timings, raw_missing, now, custom, homes, group
+):
+    """
+    Query the tmpo data of 1 home day by day, compute its raw and power data
+    and feed them into the writer.
+    Then, the gaps of the home in the raw missing table are replaced by the ones
+    found during this sync (not in custom mode).
+    - group : ptc.WriteGroup of the home. Its last timestamps and gaps are deferred :
+        they are only written once all its rows are (see 'flush_writes')
+    return the stats of the home : time spent (seconds) in each step and
+    nb raw rows
+    """
+    stats = {"hid": hid, "tmpo": 0., "compute": 0., "save": 0., "nb_raw": 0}
+    home = config.get_home(hid)
+    start_timing = set_init_seconds(timings[hid]["start_ts"])
+    end_timing = set_init_seconds(timings[hid]["end_ts"])
+    intermediate_timings = get_intermediate_timings(start_timing, end_timing)
+    display_home_info(hid, start_timing, end_timing)
+    home_gaps = {}
+    # query day by day
+    for i in range(len(intermediate_timings) - 1):
+        # generate energy df
+        if (
+                (end_timing - intermediate_timings[i]).days <= 30
+                or
+                (homes or custom)
+        ):
+            t0 = time.time()
+            energy = create_energy_series(
+                tmpo_reader, home.sensors_ids,
+                intermediate_timings[i], intermediate_timings[i + 1]
+            )
+            t1 = time.time()
+            raw, cons_prod, nb_incomplete = compute_home_series(hid, energy, home, home_sensors)
+            t2 = time.time()
+
+            save_data_threads(
+                hid, raw, energy, nb_incomplete, cons_prod,
+                config, timings, now, custom, home_gaps, group, group.deferred
+            )
+            stats["tmpo"] += t1 - t0
+            stats["compute"] += t2 - t1
+            stats["save"] += time.time() - t2
+            stats["nb_raw"] += len(raw)
+
+    if not custom:
+        raw_missing.update(
+            home_sensors.index, config.get_config_id(), start_timing, end_timing,
+            home_gaps, group.deferred
+        )
+
+    return stats
+
+
+def fetch_home_span(tmpo_reader, home_to_sync, config, timings, custom, homes):
+    """
+    Fetch stage of the span mode : the tmpo data of the home is read once for its
+    whole interval (the days that the day by day sync would query)
+    - home_to_sync : (home id, home sensors config)
+    return the span of the home : dict with its timings, energy series and stats
+    """
+    hid, home_sensors = home_to_sync
+    stats = {"hid": hid, "tmpo": 0., "compute": 0., "save": 0., "nb_raw": 0}
+    home = config.get_home(hid)
+    start_timing = set_init_seconds(timings[hid]["start_ts"])
+    end_timing = set_init_seconds(timings[hid]["end_ts"])
+    intermediate_timings = get_intermediate_timings(start_timing, end_timing)
+    display_home_info(hid, start_timing, end_timing)
+    span_starts = [
+        timing for timing in intermediate_timings[:-1]
+        if (end_timing - timing).days <= 30 or (homes or custom)
+    ]
+
+    t = time.time()
+    if len(span_starts) > 0:
+        energy = create_energy_series(
+            tmpo_reader, home.sensors_ids, span_starts[0], intermediate_timings[-1]
+        )
+    else:
+        energy = HomeSeries.empty(home.sensors_ids)
+    stats["tmpo"] += time.time() - t
+
+    return {
+        "hid": hid,
+        "home": home,
+        "home_sensors": home_sensors,
+        "start_timing": start_timing,
+        "end_timing": end_timing,
+        "energy": energy,
+        "stats": stats
+    }
+
+
+def compute_home_span(span):
+    """
+    Compute stage of the span mode : the raw and power data of the whole span
+    is computed at once. The segments between the gaps longer than GAP_THRESHOLD
+    are the same as day by day, but they are not cut at each day.
+    """
+    t = time.time()
+    span["raw"], span["cons_prod"], span["nb_incomplete"] = compute_home_series(
+        span["hid"], span["energy"], span["home"], span["home_sensors"]
+    )
+    span["stats"]["compute"] += time.time() - t
+    span["stats"]["nb_raw"] += len(span["raw"])
+    return span
+
+
+def serialize_home_span(span, config, timings, raw_missing, now, custom):
+    """
+    Serialize stage of the span mode : build the rows of the span, day by day
+    yield the rows of each day (raw and power rows) : (ptc.WriteGroup of the home,
+    ptc.PendingWrites)
+    The new last timestamps of the sensors and the gaps of the home in the raw
+    missing table (not in custom mode) are deferred in the group of the home : they
+    are not written if the rows of a day are not sent (see 'ptc.WriteGroup.send').
+    """
+    hid, raw, cons_prod, group = span["hid"], span["raw"], span["cons_prod"], span["group"]
+    for _, start, stop in get_day_slices(raw.get_index()):
+        t = time.time()
+        pending = group.new_pending()
+        save_home_raw_data(
+            hid, raw.slice(start, stop), config, timings, pending, group.deferred
+        )
+        save_home_power_data_to_cassandra(hid, cons_prod.slice(start, stop), config, pending)
+        span["stats"]["save"] += time.time() - t
+        yield group, pending
+
+    if not custom:
+        t = time.time()
+        home_gaps = {}
+        if span["nb_incomplete"] > 0:
+            save_home_missing_data(now, hid, span["energy"], home_gaps)
+        raw_missing.update(
+            span["home_sensors"].index, config.get_config_id(),
+            span["start_timing"], span["end_timing"], home_gaps, group.deferred
+        )
+        span["stats"]["save"] += time.time() - t
+
+
+def process_home_span(
+    tmpo_reader, hid, home_sensors, config, timings, raw_missing, now, custom, homes, group
+):
+    """
+    Span mode of 'process_home' : the stages of the sync pipeline
+    (see 'process_homes_pipeline') for 1 home, one after the other
+    return the stats of the home
+    """
+    span = fetch_home_span(tmpo_reader, (hid, home_sensors), config, timings, custom, homes)
+    span["group"] = group
+    compute_home_span(span)
+    for _, pending in serialize_home_span(span, config, timings, raw_missing, now, custom):
+        t = time.time()
+        group.send(pending)
+        span["stats"]["save"] += time.time() - t
+
+    return span["stats"]
+
+
+def process_homes_pipeline(
+    homes_to_sync, tmpo_session, config, timings, raw_missing, now, custom, homes,
+    stage_workers, writer
+):
+    """
+    Sync the homes in span mode by a pipeline of threads (see pipeline.py) :
+    fetch (tmpo) -> compute (raw and power data) -> serialize (rows by day)
+    -> write (fed into the writer). While the rows of a home are written,
+    the next homes are read and computed.
+    - stage_workers : dict with key : stage name, value : nb threads
+    return the stats of each home, the ptc.WriteGroup of each home
+    """
+    homes_stats = []
+    groups = []
+
+    def fetch(tmpo_reader, home_to_sync):
+        span = fetch_home_span(tmpo_reader, home_to_sync, config, timings, custom, homes)
+        span["group"] = ptc.WriteGroup(writer)
+        homes_stats.append(span["stats"])
+        groups.append(span["group"])
+        return span
+
+    stages = [
+        Stage(
+            "fetch", fetch, stage_workers["fetch"],
+            init=lambda: TmpoReader(tmpo_session.db), close=TmpoReader.close
+        ),
+        Stage("compute", compute_home_span, stage_workers["compute"]),
+        Stage(
+            "serialize",
+            lambda span: serialize_home_span(span, config, timings, raw_missing, now, custom),
+            stage_workers["serialize"],
+            expand=True
+        ),
+        # a day dropped by the stage (failed, or worker stopped) is never sent :
+        # the deferred rows of its home are not written (see 'flush_writes')
+        Stage("write", lambda day: day[0].send(day[1]), stage_workers["write"]),
+    ]
+    pipeline_stats = Pipeline(stages, SYNC_QUEUE_SIZE).run(homes_to_sync)
+    show_pipeline_stats(pipeline_stats)
+
+    return homes_stats, groups
+
+
+def flush_writes(writer, groups):
+    """
+    Wait for the rows fed into the writer (ptc.AsyncWriter) to be written, then
+    write the deferred rows of each home (ptc.WriteGroup), only if all the rows of
+    the home were written : otherwise, the next sync of the home starts again from
+    its previous last timestamps, and its rows that were not written are synced again.
+    return the list of (description, exception) of the failed write requests
+    """
+    errors = writer.flush()
+    failed = [group for group in groups if not group.send_deferred()]
+    if len(failed) > 0:
+        logging.critical(
+            "{} deferred rows of {} homes not written, because of failed writes".format(
+                sum(len(group.deferred) for group in failed),
+                len(failed)
+            )
+        )
+
+    return errors + writer.flush()
+
+
+def get_homes_to_sync(config, timings, homes):
+    """
+    Get the (home id, home sensors config) of the homes to sync :
+    the homes with a start and an end timing, restricted to 'homes' if given
+    """
+    homes_to_sync = []
+    for hid in config.get_home_ids():
+        home_sensors = config.get_home_config(hid)
         # if home has a start timestamp and a end timestamp
         if timings[hid]["start_ts"] is not None and timings[hid]["end_ts"] is not None:
-            # set init seconds (for tmpo query), might set timings
-            # earlier than planned (not a problem)
             # Skip the sync in the case where we want to sync a specific home(s)
             # Otherwise we keep sync
             if not homes or hid in homes:
-                start_timing = set_init_seconds(timings[hid]["start_ts"])
-                end_timing = set_init_seconds(timings[hid]["end_ts"])
-                intermediate_timings = get_intermediate_timings(start_timing, end_timing)
-                display_home_info(hid, start_timing, end_timing)
-                # query day by day
-                for i in range(len(intermediate_timings) - 1):
-                    # generate energy df
-                    if (
-                            (end_timing - intermediate_timings[i]).days <= 30
-                            or
-                            (homes or custom)
-                    ):
-                        energy_df = create_energy_df(
-                            tmpo_session, home_sensors,
-                            intermediate_timings[i], intermediate_timings[i + 1]
-                        )
-                        # If all values are nan, we need to add the name of the column
-                        # and we don't retrieve data
-                        if energy_df.isna().all().all():
-                            raw_df = pd.DataFrame()
-                            cons_prod_df = pd.DataFrame()
-                        else:
-                            raw_df = create_flukso_raw_df(energy_df, home_sensors)
-                            cons_prod_df = get_consumption_production_df(raw_df, home_sensors)
-
-                        incomplete_raw_df = find_incomplete_raw_df(energy_df)
-
-                        logging.info("     - len raw : {}, len NaN : {}, tot NaN: {}".format(
-                            len(raw_df.index),
-                            len(incomplete_raw_df),
-                            energy_df.isna().sum().sum()
-                        ))
-
-                        save_data_threads(
-                            hid, raw_df, incomplete_raw_df, cons_prod_df,
-                            config, timings, now, custom
-                        )
+                homes_to_sync.append((hid, home_sensors))
         else:
             logging.info("{} : No data to save".format(hid))
 
+    return homes_to_sync
+
+
+# state of a sync worker process, set by 'init_sync_worker'
+WORKER = {}
+
+
+def init_sync_worker(log_queue, config, timings, raw_missing, now, custom, homes, span):
+    """
+    Initialize a sync worker process (spawned by the main process)
+    - its log records are sent to the main process, which writes them
+    - it opens its own Cassandra session and tmpo reader, closed when
+    the worker exits (see 'close_sync_worker'). The tmpo database is only read.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    WORKER.update({
+        "tmpo_reader": TmpoReader(tmpo.Session(get_tmpo_path()).db),
+        "writer": ptc.AsyncWriter(),
+        "span": span,
+        "args": (config, timings, raw_missing, now, custom, homes)
+    })
+    multiprocessing.util.Finalize(None, close_sync_worker, exitpriority=10)
+
+
+def close_sync_worker():
+    """
+    Close the tmpo reader and the Cassandra session of a sync worker process
+    """
+    WORKER["tmpo_reader"].close()
+    ptc.close_session()
+
+
+def sync_home_worker(home):
+    """
+    Sync 1 home in a worker process, wait for its rows to be written
+    home : (home id, home sensors config)
+    return the stats of the home, nb failed write requests
+    """
+    hid, home_sensors = home
+    stats = {"hid": hid, "tmpo": 0., "compute": 0., "save": 0., "nb_raw": 0}
+    group = ptc.WriteGroup(WORKER["writer"])
+    try:
+        if WORKER["span"]:
+            stats = process_home_span(
+                WORKER["tmpo_reader"], hid, home_sensors, *WORKER["args"], group
+            )
+        else:
+            stats = process_home(
+                WORKER["tmpo_reader"], hid, home_sensors, *WORKER["args"], group
+            )
+    except Exception:
+        # rows of the home may be missing : its deferred rows are not written
+        group.fail()
+        logging.critical("Exception occured in 'sync_home_worker' : {}".format(hid), exc_info=True)
+    t = time.time()
+    nb_errors = len(flush_writes(WORKER["writer"], [group]))
+    stats["save"] += time.time() - t
+
+    return stats, nb_errors
+
+
+def process_homes_parallel(
+    homes_to_sync, workers, config, timings, raw_missing, now, custom, homes, span
+):
+    """
+    Distribute the homes across 'workers' processes
+    return the stats of each home, nb failed write requests
+    """
+    # spawn : the main process holds a Cassandra session and logging threads,
+    # a forked copy of them could deadlock the workers
+    ctx = multiprocessing.get_context("spawn")
+    log_queue = ctx.Queue()
+    listener = logging.handlers.QueueListener(
+        log_queue, *logging.getLogger().handlers, respect_handler_level=True
+    )
+    listener.start()
+    homes_stats = []
+    nb_errors = 0
+    try:
+        pool = ctx.Pool(
+            workers,
+            initializer=init_sync_worker,
+            initargs=(log_queue, config, timings, raw_missing, now, custom, homes, span)
+        )
+        try:
+            for stats, nb_home_errors in pool.imap_unordered(sync_home_worker, homes_to_sync):
+                homes_stats.append(stats)
+                nb_errors += nb_home_errors
+        finally:
+            # not 'terminate' : the workers exit normally and close their session
+            pool.close()
+            pool.join()
+    finally:
+        listener.stop()
+
+    return homes_stats, nb_errors
+
+
+def process_homes(
+    tmpo_session, config, timings, raw_missing, now, custom, homes, workers=1, span=False,
+    stage_workers=SYNC_STAGE_WORKERS
+):
+    """
+    For each home, we first create the home object containing
+    all the tmpo queries and series computation
+    Then, we save computed data in Cassandra tables.
+    - workers : nb processes syncing homes in parallel. 1 = sequential
+    - span : True to process the interval of each home at once (see 'process_home_span'),
+        by a pipeline of threads if the sync is sequential (see 'process_homes_pipeline')
+    - stage_workers : nb threads of each stage of the pipeline
+    return the stats of each home, nb failed write requests
+    """
+    homes_to_sync = get_homes_to_sync(config, timings, homes)
+    if workers > 1 and len(homes_to_sync) > 1:
+        return process_homes_parallel(
+            homes_to_sync, min(workers, len(homes_to_sync)),
+            config, timings, raw_missing, now, custom, homes, span
+        )
+
+    writer = ptc.AsyncWriter()
+    if span:
+        homes_stats, groups = process_homes_pipeline(
+            homes_to_sync, tmpo_session, config, timings, raw_missing, now, custom, homes,
+            stage_workers, writer
+        )
+    else:
+        homes_stats = []
+        # 1 group per home : a failed write only holds back the deferred rows of its home
+        groups = []
+        tmpo_reader = TmpoReader(tmpo_session.db)
+        try:
+            for hid, home_sensors in homes_to_sync:
+                groups.append(ptc.WriteGroup(writer))
+                homes_stats.append(process_home(
+                    tmpo_reader, hid, home_sensors, config, timings, raw_missing, now,
+                    custom, homes, groups[-1]
+                ))
+        finally:
+            tmpo_reader.close()
+
+    # wait for all the rows to be written
+    errors = flush_writes(writer, groups)
+
+    return homes_stats, len(errors)
+
 
 # ====================================================================================
 
@@ -817,21 +1247,59 @@ def show_processing_times(begin, setup_time, t):
     ))
 
 
+def show_homes_stats(homes_stats, nb_errors):
+    """
+    Display the time spent by all homes in each step, and the slowest home
+    homes_stats : list of stats of each home (see 'process_home')
+    nb_errors : nb failed write requests
+    """
+    if len(homes_stats) == 0:
+        return
+
+    logging.info("--------------------- Homes ----------------------")
+    logging.info("> Nb homes synced :                {}.".format(len(homes_stats)))
+    for step in ["tmpo", "compute", "save"]:
+        logging.info("> {:<32} {}.".format(
+            "Total {} time :".format(step),
+            timedelta(seconds=sum(stats[step] for stats in homes_stats))
+        ))
+    logging.info("> Nb raw rows :                    {}.".format(
+        sum(stats["nb_raw"] for stats in homes_stats)
+    ))
+    logging.info("> Nb failed write requests :       {}.".format(
+        nb_errors
+    ))
+    slowest = max(homes_stats, key=lambda stats: stats["tmpo"] + stats["compute"] + stats["save"])
+    logging.info("> Slowest home :                   {} ({}).".format(
+        slowest["hid"],
+        timedelta(seconds=slowest["tmpo"] + slowest["compute"] + slowest["save"])
+    ))
+
+
 def create_tables():
     """
     create the necessary tables for the flukso data synchronization
     """
     create_raw_flukso_table(TBL_RAW)
     create_raw_missing_table(TBL_RAW_MISSING)
+    create_raw_last_ts_table(TBL_RAW_LAST_TS)
     create_power_table(TBL_POWER)
 
 
-def sync(custom_timings, homes):
+def sync(
+    custom_timings, homes, workers=SYNC_WORKERS, full_resync=False, span=SYNC_SPAN,
+    stage_workers=SYNC_STAGE_WORKERS
+):
     logging.info("====================== Sync ======================")
 
     # custom mode (custom start and end timings)
     custom = "start_ts" in custom_timings  # custom mode
     logging.info("- Custom mode :               " + str(custom))
+    logging.info("- Workers :                   " + str(workers))
+    logging.info("- Full tmpo resync :          " + str(full_resync))
+    logging.info("- Span mode :                 " + str(span))
+    if span:
+        logging.info("- Pipeline threads :          " + str(stage_workers))
     begin = time.time()
 
     # =============================================================
@@ -841,14 +1309,8 @@ def sync(custom_timings, homes):
     # > Configuration
     config = get_last_registered_config()
     if config:
-        missing_data = ptc.select_query(
-            CASSANDRA_KEYSPACE,
-            TBL_RAW_MISSING,
-            ["*"],
-            where_clause="",
-            limit=None,
-            allow_filtering=False
-        )
+        raw_missing = get_raw_missing()
+        last_timestamps = get_last_timestamps()
 
         logging.info("- Running time (Now - CET) :  " + str(now))
         setup_time = time.time()
@@ -866,13 +1328,14 @@ def sync(custom_timings, homes):
         logging.info("---------------------- Tmpo -----------------------")
 
         # TMPO synchronization
-        tmpo_session = get_tmpo_session(config)
+        tmpo_session = get_tmpo_session(config, full_resync)
 
         # STEP 1 : get start and end timings for all homes for the query
         timings = process_timings(
             tmpo_session,
             config,
-            missing_data,
+            raw_missing,
+            last_timestamps,
             now,
             custom_timings
         )
@@ -884,12 +1347,16 @@ def sync(custom_timings, homes):
         logging.info("Generating homes data, getting Flukso data and save in Cassandra...")
 
         # STEP 2 : process all homes data, and save in database
-        process_homes(tmpo_session, config, timings, now, custom, homes)
+        homes_stats, nb_errors = process_homes(
+            tmpo_session, config, timings, raw_missing, now, custom, homes, workers, span,
+            stage_workers
+        )
 
         timer["homes"] = time.time()
 
         # =========================================================
 
+        show_homes_stats(homes_stats, nb_errors)
         show_processing_times(begin, setup_time, timer)
     else:
         logging.debug("No registered config in db.")
@@ -949,6 +1416,35 @@ def get_arguments():
         help="Give home(s) that you want to sync. You can sync one or more homes. Format : 'HOMEID1 HOMEID2 HOMEID3'"
     )
 
+    argparser.add_argument(
+        "--workers",
+        type=int,
+        default=SYNC_WORKERS,
+        help="Number of processes syncing homes in parallel. Default : {}".format(SYNC_WORKERS)
+    )
+
+    argparser.add_argument(
+        "--span",
+        action="store_true",
+        default=SYNC_SPAN,
+        help="Process the interval of each home at once instead of day by day"
+    )
+
+    argparser.add_argument(
+        "--stage-workers",
+        type=int,
+        nargs=4,
+        metavar=("FETCH", "COMPUTE", "SERIALIZE", "WRITE"),
+        default=[SYNC_STAGE_WORKERS[stage] for stage in SYNC_STAGES],
+        help="Span mode : nb threads of each stage of the sync pipeline"
+    )
+
+    argparser.add_argument(
+        "--full-resync",
+        action="store_true",
+        help="Request all the tmpo blocks of all the sensors, ignoring their watermark"
+    )
+
     return argparser.parse_args()
 
 
@@ -958,11 +1454,15 @@ def main():
     # Custom timings argument
     custom_timings = process_custom_timings(args.start, args.end)
 
-    # first, create tables if needed:
-    create_tables()
+    with ptc.cassandra_session():
+        # first, create tables if needed:
+        create_tables()
 
-    # then, sync new data in Cassandra
-    sync(custom_timings, args.homes.split())
+        # then, sync new data in Cassandra
+        sync(
+            custom_timings, args.homes.split(), args.workers, args.full_resync, args.span,
+            dict(zip(SYNC_STAGES, args.stage_workers))
+        )
 
 
 if __name__ == "__main__":
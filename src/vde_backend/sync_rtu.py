@@ -50,17 +50,18 @@ def prepare_rtu_row(vals: pd.Series, ip: str):
 
 
 def main():
-    create_rtu_table()
-    creds = ptc.load_json_credentials(RTU_CREDENTIALS_FILE)
-    rtu = RTUConnector(RTU_IP_ADDR, creds['user'], creds['pwd'])
-    rtudat = rtu.read_values()
-    rtu_row = prepare_rtu_row(rtudat, rtu.addr)
-    ptc.insert(
-        CASSANDRA_KEYSPACE,
-        TBL_RTU_DATA,
-        rtu_row.index,
-        rtu_row.values
-    )
+    with ptc.cassandra_session():
+        create_rtu_table()
+        creds = ptc.load_json_credentials(RTU_CREDENTIALS_FILE)
+        rtu = RTUConnector(RTU_IP_ADDR, creds['user'], creds['pwd'])
+        rtudat = rtu.read_values()
+        rtu_row = prepare_rtu_row(rtudat, rtu.addr)
+        ptc.insert(
+            CASSANDRA_KEYSPACE,
+            TBL_RTU_DATA,
+            rtu_row.index,
+            rtu_row.values
+        )
 
 
 if __name__ == '__main__':
@@ -49,6 +49,7 @@ from constants import (
     PROD,
     SFTP_LOCAL_PATH,
     CASSANDRA_KEYSPACE,
+    RANGE_READ_DAYS,
     TBL_POWER
 )
 import py_to_cassandra as ptc
@@ -57,7 +58,7 @@ from utils import (
     logging,
     get_dates_between,
     get_last_registered_config,
-    get_home_power_data_from_cassandra
+    get_home_power_data_range
 )
 
 
@@ -201,6 +202,18 @@ def get_moments(dates, default_moment):
     return moments
 
 
+def get_moment_data(date_df, date, moment):
+    """
+    Given the power data of 1 day, get the rows of 1 moment (AM or PM) of this day
+    """
+    if len(date_df) == 0:
+        return date_df
+    noon = pd.Timestamp("{} {}".format(date, NOON))
+    if moment == AM:
+        return date_df[date_df["ts"] <= noon]
+    return date_df[date_df["ts"] > noon]
+
+
 def get_all_history_dates(home_id, table_name, now):
     """
     For a home, get the first timestamp available in the db, and
@@ -248,23 +261,24 @@ def process_all_homes(sftp_session, config, default_date, moment, moment_now, no
             all_dates = get_dates_between(latest_date, now)
             moments = get_moments(all_dates, moment_now)
 
-        for date in moments:
-            for moment in moments[date]:
-                csv_filename = get_csv_filename(home_id, date, moment)
-                logging.debug(csv_filename)
-                home_data = get_home_power_data_from_cassandra(
-                    home_id,
-                    date,
-                    moment,
-                    TBL_POWER,
-                    ts_clause="AND ts {} '{} {}'".format(moment, date, NOON)
-                )
-
-                # first save csv locally
-                save_data_to_csv(home_data.set_index("home_id"), csv_filename)
-                if PROD:
-                    # then, send to sftp server
-                    send_file_to_sftp(sftp_session, csv_filename, sftp_info)
+        # fetch the days by windows of RANGE_READ_DAYS days
+        dates = list(moments.keys())
+        for i in range(0, len(dates), RANGE_READ_DAYS):
+            home_data = get_home_power_data_range(home_id, dates[i:i + RANGE_READ_DAYS])
+
+            for date, date_df in home_data.items():
+                for moment in moments[date]:
+                    csv_filename = get_csv_filename(home_id, date, moment)
+                    logging.debug(csv_filename)
+
+                    # first save csv locally
+                    save_data_to_csv(
+                        get_moment_data(date_df, date, moment).set_index("home_id"),
+                        csv_filename
+                    )
+                    if PROD:
+                        # then, send to sftp server
+                        send_file_to_sftp(sftp_session, csv_filename, sftp_info)
 
         logging.debug("-----------------------")
 
@@ -297,28 +311,29 @@ def main():
     sftp_info = ptc.load_json_credentials(sftp_info_filename)
     sftp_session = get_sftp_session(sftp_info)
 
-    config = get_last_registered_config()
-
-    if config:
-        now = pd.Timestamp.now()
-        default_date, moment, moment_now = get_date_to_query(now)
-
-        logging.debug("config id : " + str(config.get_config_id()))
-        logging.debug("date : " + default_date)
-        logging.debug("moment : " + moment)
-        logging.debug("moment now : " + moment_now)
-
-        process_all_homes(
-            sftp_session,
-            config,
-            default_date,
-            moment,
-            moment_now,
-            now,
-            sftp_info
-        )
-    else:
-        logging.debug("No registered config in db.")
+    with ptc.cassandra_session():
+        config = get_last_registered_config()
+
+        if config:
+            now = pd.Timestamp.now()
+            default_date, moment, moment_now = get_date_to_query(now)
+
+            logging.debug("config id : " + str(config.get_config_id()))
+            logging.debug("date : " + default_date)
+            logging.debug("moment : " + moment)
+            logging.debug("moment now : " + moment_now)
+
+            process_all_homes(
+                sftp_session,
+                config,
+                default_date,
+                moment,
+                moment_now,
+                now,
+                sftp_info
+            )
+        else:
+            logging.debug("No registered config in db.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+__title__ = "tmpo_reader"
+__version__ = "2.0.0"
+__author__ = "Alexandre Heneffe, Guillaume Levasseur, and Brice Petit"
+__license__ = "MIT"
+
+
+"""
+Reader of the energy series of the sensors, directly from the tmpo database.
+Unlike 'tmpo.Session.series', the database is opened once, the list of the blocks
+of a sensor is read once, and the decoded blocks are kept in a LRU cache :
+the day windows of a home share their blocks instead of decoding them again.
+Same series as 'tmpo.Session.series', as int64 epochs and float64 values.
+"""
+
+
+# standard library
+import json
+import logging
+import sqlite3
+import zlib
+from collections import OrderedDict
+
+# 3rd party packages
+import numpy as np
+import tmpo
+
+# local sources
+from constants import TMPO_BLOCK_CACHE_BYTES
+from utils import to_epochs
+
+
+SQL_TMPO_BLOCKS = """
+    SELECT rid, lvl, bid, ext
+    FROM tmpo
+    WHERE sid = ?"""
+
+SQL_TMPO_DATA = """
+    SELECT data
+    FROM tmpo
+    WHERE sid = ? AND rid = ? AND lvl = ? AND bid = ?"""
+
+
+def decode_block(ext, data):
+    """
+    Decode a tmpo block : gzipped json, with the timestamps and values
+    encoded as deltas from the head of the block
+    return 2 arrays : epochs (seconds, int64), values (float64)
+    """
+    if ext != "gz":
+        raise NotImplementedError("Compression type not supported in tmpo")
+    block = json.loads(zlib.decompress(data, zlib.MAX_WBITS | 16).decode("utf-8"))
+    head_epoch, head_value = block["h"]["head"]
+    # the running sums start from the head, in the same order as tmpo
+    epochs = np.cumsum(np.array([head_epoch] + block["t"], dtype=np.int64))[1:]
+    values = np.cumsum(np.array([head_value] + block["v"], dtype=np.float64))[1:]
+    return epochs, values
+
+
+class TmpoReader:
+    def __init__(self, db, cache_bytes=TMPO_BLOCK_CACHE_BYTES):
+        self.con = sqlite3.connect(db)
+        self.cache_bytes = cache_bytes
+        # key : (sid, rid, lvl, bid), value : (epochs, values), least recently used first
+        self.blocks = OrderedDict()
+        self.nb_bytes = 0
+        # key : sensor id, value : list of (lvl, bid, ext) of its last recycle id,
+        # in the order of tmpo
+        self.sensors_blocks = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    def close(self):
+        self.con.close()
+
+    def get_sensor_blocks(self, sid):
+        """
+        Get the rid and the list of (lvl, bid, ext) of the blocks of the last
+        recycle id of a sensor (read once)
+        """
+        if sid not in self.sensors_blocks:
+            rows = self.con.execute(SQL_TMPO_BLOCKS, (sid,)).fetchall()
+            rid = max((row[0] for row in rows), default=None)
+            # like tmpo : lvl DESC, bid ASC
+            blocks = sorted(
+                ((lvl, bid, ext) for r, lvl, bid, ext in rows if r == rid),
+                key=lambda block: (-block[0], block[1])
+            )
+            self.sensors_blocks[sid] = (rid, blocks)
+        return self.sensors_blocks[sid]
+
+    def get_block(self, sid, rid, lvl, bid, ext):
+        """
+        Get a decoded block, from the cache if possible
+        """
+        key = (sid, rid, lvl, bid)
+        if key in self.blocks:
+            self.stats["hits"] += 1
+            self.blocks.move_to_end(key)
+            return self.blocks[key]
+
+        self.stats["misses"] += 1
+        data, = self.con.execute(SQL_TMPO_DATA, key).fetchone()
+        try:
+            block = decode_block(ext, data)
+        except Exception:
+            logging.warning("Cannot decode the tmpo block {}".format(key), exc_info=True)
+            block = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+
+        self.blocks[key] = block
+        self.nb_bytes += block[0].nbytes + block[1].nbytes
+        while self.nb_bytes > self.cache_bytes and len(self.blocks) > 1:
+            _, (epochs, values) = self.blocks.popitem(last=False)
+            self.nb_bytes -= epochs.nbytes + values.nbytes
+        return block
+
+    def read(self, sid, head, tail=None):
+        """
+        Get the series of a sensor between 'head' and 'tail' (included),
+        like 'tmpo.Session.series'
+        - head, tail : pandas Timestamps, tail None : until the last value
+        return 2 arrays : epochs (nanoseconds, int64), values (float64)
+        """
+        head = to_epochs(head)
+        tail = tmpo.EPOCHS_MAX if tail is None else to_epochs(tail)
+
+        rid, blocks = self.get_sensor_blocks(sid)
+        parts = []
+        for lvl, bid, ext in blocks:
+            # the block covers [bid, bid + 2^lvl[
+            if head < bid + 2 ** lvl and tail >= bid:
+                epochs, values = self.get_block(sid, rid, lvl, bid, ext)
+                start = np.searchsorted(epochs, head, side="left")
+                stop = np.searchsorted(epochs, tail, side="right")
+                parts.append((epochs[start:stop], values[start:stop]))
+
+        if len(parts) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        epochs = np.concatenate([epochs for epochs, _ in parts]) * 10**9
+        return epochs, np.concatenate([values for _, values in parts])
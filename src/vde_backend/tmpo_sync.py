@@ -0,0 +1,426 @@
+__title__ = "tmpo_sync"
+__version__ = "2.0.0"
+__author__ = "Alexandre Heneffe, Guillaume Levasseur, and Brice Petit"
+__license__ = "MIT"
+
+
+"""
+Synchronization of the local tmpo database with the Flukso API, sensor by sensor.
+The new blocks of the sensors are downloaded concurrently by a bounded thread pool,
+with a timeout and retries per sensor. They are written in the tmpo database by the
+calling thread only (1 sqlite connection).
+A sensor failing all its attempts is quarantined : it is not synced again before
+TMPO_QUARANTINE, and it does not block the other sensors.
+The last block fetched for each sensor (its watermark) is stored in the tmpo database,
+with the blocks : only newer blocks are requested, and sensors synced less than
+TMPO_MIN_SYNC_INTERVAL ago are skipped, unless a full resync is forced.
+"""
+
+
+# standard library
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# 3rd party packages
+import pandas as pd
+import requests
+import tmpo
+
+# local sources
+from constants import (
+    TMPO_MIN_SYNC_INTERVAL,
+    TMPO_QUARANTINE,
+    TMPO_SYNC_ATTEMPTS,
+    TMPO_SYNC_BACKOFF,
+    TMPO_SYNC_TIMEOUT,
+    TMPO_SYNC_WORKERS
+)
+
+
+QUARANTINE_FILE = "quarantine.json"
+SQL_SENSOR_UPSERT = "INSERT OR REPLACE INTO sensor (sid, token) VALUES (?, ?)"
+SQL_TMPO_UPSERT = tmpo.SQL_TMPO_INS.replace("INSERT", "INSERT OR REPLACE", 1)
+SQL_WATERMARK_TABLE = """
+    CREATE TABLE IF NOT EXISTS watermark(
+    sid TEXT,
+    rid INTEGER,
+    lvl INTEGER,
+    bid INTEGER,
+    first_bid INTEGER,
+    synced REAL,
+    PRIMARY KEY(sid))"""
+SQL_WATERMARK_ALL = "SELECT sid, rid, lvl, bid, first_bid, synced FROM watermark"
+SQL_WATERMARK_UPSERT = """
+    INSERT OR REPLACE INTO watermark
+    (sid, rid, lvl, bid, first_bid, synced)
+    VALUES (?, ?, ?, ?, ?, ?)"""
+# the Flukso API is not polled again for a sensor before this delay (seconds)
+# after its last block, like tmpo
+POLLING_DELAY = 256
+
+# size (bytes) of the parts of a response read at once : the deadline
+# of the sensor is checked between them
+CHUNK_SIZE = 64 * 1024
+
+# 1 HTTP session per download thread
+THREAD_LOCAL = threading.local()
+
+# last block fetched for a sensor (rid, lvl, bid), the bid of its first block
+# (= its first timestamp) and the time of its last successful sync (epoch)
+Watermark = namedtuple("Watermark", ["rid", "lvl", "bid", "first_bid", "synced"])
+# key : tmpo database path, value : dict with key : sensor id, value : Watermark
+WATERMARKS = {}
+
+
+def get_http_session():
+    if getattr(THREAD_LOCAL, "http", None) is None:
+        THREAD_LOCAL.http = requests.Session()
+        THREAD_LOCAL.http.headers.update({"X-Version": "1.0"})
+    return THREAD_LOCAL.http
+
+
+def get_remaining_time(deadline):
+    """
+    Get the time (seconds) left before the deadline, raise TimeoutError if none
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("sensor sync longer than {} s".format(TMPO_SYNC_TIMEOUT))
+    return remaining
+
+
+def get_content(http, url, deadline, **kwargs):
+    """
+    Send a GET request, return the content of its response.
+    The response is read by chunks until the deadline : the timeout of requests
+    only limits each read, not a slow download.
+    """
+    response = http.get(url, stream=True, timeout=get_remaining_time(deadline), **kwargs)
+    try:
+        response.raise_for_status()
+        chunks = []
+        for chunk in response.iter_content(CHUNK_SIZE):
+            chunks.append(chunk)
+            get_remaining_time(deadline)
+        return b"".join(chunks)
+    finally:
+        response.close()
+
+
+def fetch_blocks(tmpo_session, sid, token, last_block):
+    """
+    Download the blocks of a sensor more recent than its last block,
+    in at most TMPO_SYNC_TIMEOUT seconds
+    - last_block : (rid, lvl, bid) of the last block in the tmpo database
+    return the list of (rid, lvl, bid, ext, content)
+    """
+    deadline = time.monotonic() + TMPO_SYNC_TIMEOUT
+    http = get_http_session()
+    rid, lvl, bid = last_block
+
+    new_blocks = json.loads(get_content(
+        http,
+        tmpo.API_TMPO_SYNC % (tmpo_session.host, sid),
+        deadline,
+        headers={"Accept": tmpo.HTTP_ACCEPT["json"], "X-Token": token},
+        params={"rid": rid, "lvl": lvl, "bid": bid},
+        verify=tmpo_session.crt
+    ).decode("utf-8"))
+
+    blocks = []
+    for block in new_blocks:
+        content = get_content(
+            http,
+            tmpo.API_TMPO_BLOCK % (
+                tmpo_session.host, sid, block["rid"], block["lvl"], block["bid"]
+            ),
+            deadline,
+            headers={"Accept": tmpo.HTTP_ACCEPT["gz"], "X-Token": token},
+            verify=tmpo_session.crt
+        )
+        blocks.append((block["rid"], block["lvl"], block["bid"], block["ext"], content))
+    return blocks
+
+
+def is_transient(error):
+    """
+    An error is transient (worth a retry) unless the API refused the request
+    (ex: invalid token), except for rate limiting
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or not 400 <= status < 500
+    return True
+
+
+def download_sensor(tmpo_session, sid, token, last_block):
+    """
+    Download the new blocks of 1 sensor, in at most TMPO_SYNC_ATTEMPTS attempts
+    return the blocks (None if failed) and the report of the sensor :
+    sensor id, ok, nb attempts, latency (seconds), nb blocks, last error
+    """
+    report = {"sid": sid, "ok": False, "attempts": 0, "latency": 0., "blocks": 0, "error": None}
+    begin = time.monotonic()
+    blocks = None
+    for attempt in range(1, TMPO_SYNC_ATTEMPTS + 1):
+        report["attempts"] = attempt
+        try:
+            blocks = fetch_blocks(tmpo_session, sid, token, last_block)
+            break
+        except Exception as e:
+            report["error"] = repr(e)
+            if not is_transient(e) or attempt == TMPO_SYNC_ATTEMPTS:
+                break
+            time.sleep(TMPO_SYNC_BACKOFF * 2 ** (attempt - 1))
+
+    report["latency"] = time.monotonic() - begin
+    if blocks is not None:
+        report["ok"] = True
+        report["blocks"] = len(blocks)
+    return blocks, report
+
+
+def clean_blocks(cur, sid, rid, lvl, bid):
+    """
+    Delete the blocks of lower levels covered by the block (rid, lvl, bid), like tmpo
+    """
+    while lvl > 8:
+        last_child = bid + 15 * 2 ** (lvl - 4)
+        cur.execute(tmpo.SQL_TMPO_CLEAN, (sid, rid, lvl - 4, last_child))
+        lvl, bid = lvl - 4, last_child
+
+
+def load_watermarks(cur):
+    cur.execute(SQL_WATERMARK_TABLE)
+    return {row[0]: Watermark(*row[1:]) for row in cur.execute(SQL_WATERMARK_ALL)}
+
+
+def get_watermarks(tmpo_session):
+    """
+    Get the watermarks of the sensors of the tmpo database (loaded once per process)
+    """
+    if tmpo_session.db not in WATERMARKS:
+        con = sqlite3.connect(tmpo_session.db)
+        try:
+            WATERMARKS[tmpo_session.db] = load_watermarks(con.cursor())
+            con.commit()
+        finally:
+            con.close()
+    return WATERMARKS[tmpo_session.db]
+
+
+def get_first_timestamp(tmpo_session, sid):
+    """
+    Get the first timestamp of a sensor in the tmpo database (UTC timezone) from
+    its watermark, or from its blocks if no watermark. None if no block.
+    """
+    watermark = get_watermarks(tmpo_session).get(sid)
+    if watermark is not None and watermark.first_bid is not None:
+        return pd.Timestamp(watermark.first_bid, unit="s", tz="UTC")
+    return tmpo_session.first_timestamp(sid)
+
+
+def get_watermark(cur, sid, synced):
+    """
+    Build the watermark of a sensor from its blocks in the tmpo database,
+    None if no block
+    """
+    last = cur.execute(tmpo.SQL_TMPO_LAST, (sid,)).fetchone()
+    if last is None:
+        return None
+    rid, lvl, bid, _ = last
+    first_bid = cur.execute(tmpo.SQL_TMPO_FIRST, (sid,)).fetchone()[2]
+    return Watermark(rid, lvl, bid, first_bid, synced)
+
+
+def write_blocks(con, sid, blocks, watermark, now):
+    """
+    Write the downloaded blocks of a sensor in the tmpo database, and its new
+    watermark, in 1 transaction
+    return the new watermark
+    """
+    cur = con.cursor()
+    try:
+        for rid, lvl, bid, ext, content in blocks:
+            cur.execute(
+                SQL_TMPO_UPSERT, (sid, rid, lvl, bid, ext, time.time(), sqlite3.Binary(content))
+            )
+            clean_blocks(cur, sid, rid, lvl, bid)
+
+        first_bid = None if watermark is None else watermark.first_bid
+        if len(blocks) > 0:
+            rid, lvl, bid = blocks[-1][:3]
+            first_bids = [block[2] for block in blocks] + [first_bid]
+            watermark = Watermark(
+                rid, lvl, bid, min(b for b in first_bids if b is not None), now
+            )
+        elif watermark is not None:
+            watermark = watermark._replace(synced=now)
+        if watermark is not None:
+            cur.execute(SQL_WATERMARK_UPSERT, (sid,) + tuple(watermark))
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return watermark
+
+
+def load_quarantine(path):
+    """
+    return a dictionary with key : sensor id,
+    value : {"failures": nb consecutive failed syncs, "until": end of quarantine (epoch)}
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception:
+        logging.warning("Cannot read the tmpo quarantine file '{}'".format(path), exc_info=True)
+        return {}
+
+
+def save_quarantine(path, quarantine):
+    try:
+        with open(path, "w") as f:
+            json.dump(quarantine, f, indent=1)
+    except Exception:
+        logging.warning("Cannot write the tmpo quarantine file '{}'".format(path), exc_info=True)
+
+
+def get_sensors_to_sync(
+    con, sensors, quarantine, watermarks, now, full_resync, use_sync_interval=True
+):
+    """
+    Register the sensors (and their token) in the tmpo database, and get the ones to sync :
+    not quarantined, not synced less than TMPO_MIN_SYNC_INTERVAL ago and not polled
+    recently (see POLLING_DELAY). The blocks newer than the watermark of a sensor
+    are requested, all its blocks if no watermark or if 'full_resync'.
+    - watermarks : updated in place for the sensors without one but with blocks
+    - use_sync_interval : False to also sync the sensors synced or polled recently
+    return the list of (sensor id, token, last block), the quarantined sensors,
+    and the nb sensors up to date
+    """
+    cur = con.cursor()
+    cur.execute(tmpo.SQL_SENSOR_TABLE)
+    cur.execute(tmpo.SQL_TMPO_TABLE)
+    cur.executemany(SQL_SENSOR_UPSERT, sensors)
+
+    to_sync = []
+    quarantined = []
+    nb_up_to_date = 0
+    for sid, token in sensors:
+        if full_resync:
+            to_sync.append((sid, token, (0, 0, 0)))
+            continue
+        if quarantine.get(sid, {}).get("until", 0) > now:
+            quarantined.append(sid)
+            continue
+
+        watermark = watermarks.get(sid)
+        if watermark is None:
+            # 1st sync of the sensor, or blocks synced before the watermarks
+            watermark = get_watermark(cur, sid, synced=0.)
+            if watermark is None:
+                to_sync.append((sid, token, (0, 0, 0)))
+                continue
+            clean_blocks(cur, sid, watermark.rid, watermark.lvl, watermark.bid)
+            cur.execute(SQL_WATERMARK_UPSERT, (sid,) + tuple(watermark))
+            watermarks[sid] = watermark
+
+        recent = (
+            now - watermark.synced < TMPO_MIN_SYNC_INTERVAL or now < watermark.bid + POLLING_DELAY
+        )
+        if use_sync_interval and recent:
+            nb_up_to_date += 1
+        else:
+            to_sync.append((sid, token, (watermark.rid, watermark.lvl, watermark.bid)))
+    con.commit()
+
+    return to_sync, quarantined, nb_up_to_date
+
+
+def sync_sensors(
+    tmpo_session, sensors, workers=TMPO_SYNC_WORKERS, use_quarantine=True,
+    use_sync_interval=True, full_resync=False
+):
+    """
+    Synchronize the tmpo database of the session with the Flukso API
+    - sensors : list of (sensor id, token)
+    - use_quarantine : False to also sync the quarantined sensors
+    - use_sync_interval : False to also sync the sensors synced less than
+        TMPO_MIN_SYNC_INTERVAL ago or polled recently (see POLLING_DELAY)
+    - full_resync : True to request all the blocks of all the sensors
+        (ignore the watermarks and the quarantine)
+    return the reports of the synced sensors (see 'download_sensor')
+    """
+    quarantine_path = os.path.join(tmpo_session.home, QUARANTINE_FILE)
+    quarantine = load_quarantine(quarantine_path)
+    quarantine_delay = pd.Timedelta(TMPO_QUARANTINE).total_seconds()
+
+    reports = []
+    con = sqlite3.connect(tmpo_session.db)
+    try:
+        watermarks = load_watermarks(con.cursor())
+        to_sync, quarantined, nb_up_to_date = get_sensors_to_sync(
+            con, sensors, quarantine if use_quarantine else {}, watermarks, time.time(),
+            full_resync, use_sync_interval
+        )
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(download_sensor, tmpo_session, sid, token, last_block)
+                for sid, token, last_block in to_sync
+            ]
+            # the blocks are written as soon as the download of a sensor is complete
+            for future in concurrent.futures.as_completed(futures):
+                blocks, report = future.result()
+                sid = report["sid"]
+                if report["ok"]:
+                    try:
+                        watermark = write_blocks(
+                            con, sid, blocks, watermarks.get(sid), time.time()
+                        )
+                        if watermark is not None:
+                            watermarks[sid] = watermark
+                    except Exception as e:
+                        report["ok"] = False
+                        report["error"] = repr(e)
+
+                if report["ok"]:
+                    quarantine.pop(sid, None)
+                else:
+                    failures = quarantine.get(sid, {}).get("failures", 0) + 1
+                    quarantine[sid] = {
+                        "failures": failures, "until": time.time() + quarantine_delay
+                    }
+                    logging.warning("tmpo sync of {} failed ({} attempts) : {}".format(
+                        sid, report["attempts"], report["error"]
+                    ))
+                reports.append(report)
+    finally:
+        con.close()
+    WATERMARKS[tmpo_session.db] = watermarks
+
+    save_quarantine(quarantine_path, quarantine)
+    show_sync_report(reports, quarantined, nb_up_to_date)
+    return reports
+
+
+def show_sync_report(reports, quarantined, nb_up_to_date):
+    nb_ok = sum(report["ok"] for report in reports)
+    logging.info("> tmpo sync : {} synced, {} failed, {} up to date, {} quarantined".format(
+        nb_ok, len(reports) - nb_ok, nb_up_to_date, len(quarantined)
+    ))
+    if len(quarantined) > 0:
+        logging.info("> Quarantined sensors (not synced) : {}".format(", ".join(quarantined)))
+    if len(reports) > 0:
+        slowest = max(reports, key=lambda report: report["latency"])
+        logging.info("> Slowest sensor : {} ({:.2f} s, {} blocks)".format(
+            slowest["sid"], slowest["latency"], slowest["blocks"]
+        ))
@@ -9,6 +9,7 @@ import os
 import sys
 import os.path
 import math
+import pickle
 from datetime import timedelta
 
 # 3rd party packages
@@ -17,13 +18,22 @@ import numpy as np
 import logging
 import logging.handlers
 
+# optional : compiled energy2power kernel
+try:
+    import numba
+except ImportError:
+    numba = None
+
 # local sources
 from constants import (
     CASSANDRA_KEYSPACE,
+    CONFIG_CACHE_PATH,
+    ENERGY2POWER_ENGINE,
     FREQ,
     LOG_LEVEL,
     LOG_FILE,
     LOG_HANDLER,
+    TBL_CURRENT_CONFIG,
     TBL_POWER,
     TBL_SENSORS_CONFIG,
 )
@@ -74,6 +84,7 @@ def get_log_handler():
 logging.getLogger("tmpo").setLevel(logging.ERROR)
 logging.getLogger("requests").setLevel(logging.ERROR)
 logging.getLogger("urllib3").setLevel(logging.ERROR)
+logging.getLogger("numba").setLevel(logging.ERROR)
 
 logging.basicConfig(
     level=setup_log_level(),
@@ -110,9 +121,10 @@ def set_init_seconds(ts):
     return ts.replace(second=4 if ts.minute % 2 != 0 else 0)
 
 
-def get_last_registered_config():
+def get_last_config_id():
     """
-    Get the last registered config based on insertion time
+    Get the id (insertion time) of the last registered config by scanning
+    the whole config table, None if no config in db yet
     """
     latest_configs = ptc.groupby_query(
         CASSANDRA_KEYSPACE,
@@ -125,7 +137,117 @@ def get_last_registered_config():
     )
     if len(latest_configs) == 0:  # if no config in db yet.
         return None
-    last_config_id = latest_configs.max().max().tz_localize('UTC')
+    return latest_configs.max().max().tz_localize('UTC')
+
+
+def get_current_config_id():
+    """
+    Get the id of the current config from its pointer row, written by
+    preprocess_sensors_config (1 point read).
+    None if the pointer is not written yet.
+    """
+    try:
+        pointer_df = ptc.select_query(
+            CASSANDRA_KEYSPACE,
+            TBL_CURRENT_CONFIG,
+            ["config_id"],
+            "name = '{}'".format(TBL_SENSORS_CONFIG),
+            allow_filtering=False,
+            tz="UTC"
+        )
+    except Exception:
+        # the pointer table does not exist yet
+        logging.debug("No current config pointer, scan the config table", exc_info=True)
+        return None
+    if len(pointer_df) == 0:
+        return None
+    return pointer_df.iat[0, 0]
+
+
+# version of the content of the cached config files : to increase when it changes,
+# the files of the other versions are ignored
+CONFIG_CACHE_VERSION = 1
+
+
+def get_config_cache_file(config_id):
+    return os.path.join(CONFIG_CACHE_PATH, "config_{}.pkl".format(config_id.value // 10**6))
+
+
+def load_cached_config(config_id):
+    """
+    Load the config from the local cache, None if not cached (or unreadable,
+    or cached by another version)
+    The config dataframe is cached, the Configuration is built again from it.
+    """
+    if CONFIG_CACHE_PATH is None:
+        return None
+    path = get_config_cache_file(config_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            cached = pickle.load(f)
+        if (
+                not isinstance(cached, dict)
+                or cached.get("version") != CONFIG_CACHE_VERSION
+                or cached["config_id"] != config_id
+        ):
+            logging.info("Outdated cached config '{}'".format(path))
+            return None
+        return Configuration(config_id, cached["config_df"])
+    except Exception:
+        logging.warning("Cannot read the cached config '{}'".format(path), exc_info=True)
+        return None
+
+
+def save_cached_config(config):
+    """
+    Save the config in the local cache, in place of the previous ones
+    """
+    if CONFIG_CACHE_PATH is None:
+        return
+    try:
+        os.makedirs(CONFIG_CACHE_PATH, exist_ok=True)
+        path = get_config_cache_file(config.get_config_id())
+        # several jobs can start at the same time : write then rename
+        tmp_path = "{}.{}".format(path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump(
+                {
+                    "version": CONFIG_CACHE_VERSION,
+                    "config_id": config.get_config_id(),
+                    "config_df": config.get_sensors_config()
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(tmp_path, path)
+
+        for filename in os.listdir(CONFIG_CACHE_PATH):
+            old_path = os.path.join(CONFIG_CACHE_PATH, filename)
+            if filename.startswith("config_") and filename.endswith(".pkl") and old_path != path:
+                os.remove(old_path)
+    except Exception:
+        logging.warning("Cannot save the config in the cache", exc_info=True)
+
+
+def get_last_registered_config():
+    """
+    Get the last registered config based on insertion time.
+    Its id is read from the current config pointer (or found by scanning the
+    config table if no pointer), then the config is loaded from the local cache,
+    or from the config table if it is not cached yet.
+    """
+    last_config_id = get_current_config_id()
+    if last_config_id is None:
+        last_config_id = get_last_config_id()
+        if last_config_id is None:  # if no config in db yet.
+            return None
+
+    config = load_cached_config(last_config_id)
+    if config is not None:
+        return config
+
     config_df = ptc.select_query(
         CASSANDRA_KEYSPACE,
         TBL_SENSORS_CONFIG,
@@ -133,6 +255,7 @@ def get_last_registered_config():
         "insertion_time = '{}'".format(last_config_id),
     )
     config = Configuration(last_config_id, config_df.set_index("sensor_id"))
+    save_cached_config(config)
     return config
 
 
@@ -163,6 +286,16 @@ def get_all_registered_configs():
     return configs
 
 
+POWER_COLUMNS = [
+    "home_id",
+    "day",
+    "ts",
+    "p_cons",
+    "p_prod",
+    "p_tot"
+]
+
+
 def get_home_power_data_from_cassandra(home_id, date, ts_clause=""):
     """
     Get power data from Power table in Cassandra
@@ -171,25 +304,52 @@ def get_home_power_data_from_cassandra(home_id, date, ts_clause=""):
     """
 
     where_clause = "home_id = '{}' and day = '{}' {}".format(home_id, date, ts_clause)
-    cols = [
-        "home_id",
-        "day",
-        "ts",
-        "p_cons",
-        "p_prod",
-        "p_tot"
-    ]
 
     home_df = ptc.select_query(
         CASSANDRA_KEYSPACE,
         TBL_POWER,
-        cols,
+        POWER_COLUMNS,
         where_clause,
     )
 
     return home_df
 
 
+def get_home_power_data_chunks(home_id, date, ts_clause=""):
+    """
+    Streaming variant of 'get_home_power_data_from_cassandra' :
+    yield the power data of 1 home, 1 day, page by page
+    """
+
+    where_clause = "home_id = '{}' and day = '{}' {}".format(home_id, date, ts_clause)
+
+    return ptc.select_query_chunks(
+        CASSANDRA_KEYSPACE,
+        TBL_POWER,
+        POWER_COLUMNS,
+        where_clause,
+    )
+
+
+def get_home_power_data_range(home_id, dates):
+    """
+    Get power data from Power table in Cassandra
+    > for 1 specific home
+    > several days, 1 query per day, processed concurrently
+
+    return a dictionary with key : date, value : power data of the day
+    """
+
+    return ptc.select_range(
+        CASSANDRA_KEYSPACE,
+        TBL_POWER,
+        POWER_COLUMNS,
+        "home_id",
+        [home_id],
+        dates
+    )
+
+
 def get_dates_between(start_date, end_date):
     """
     get the list of dates between 2 given dates
@@ -208,10 +368,48 @@ def get_dates_between(start_date, end_date):
     return dates
 
 
+def get_day_slices(index):
+    """
+    Split a sorted DatetimeIndex by day (in the timezone of the index)
+    return a list of (day, start, stop) : the timestamps of 'day' (YYYY-MM-DD)
+    are index[start:stop]
+    """
+    if len(index) == 0:
+        return []
+    # integer day codes : epochs of the midnight of each timestamp
+    day_codes = index_to_epochs_ns(index.normalize())
+    starts = np.flatnonzero(day_codes[1:] != day_codes[:-1]) + 1
+    starts = np.concatenate(([0], starts))
+    stops = np.concatenate((starts[1:], [len(index)]))
+
+    return [
+        (str(index[start].date()), start, stop)
+        for start, stop in zip(starts.tolist(), stops.tolist())
+    ]
+
+
+def get_days(index):
+    """
+    Get the day (YYYY-MM-DD) of each timestamp of a sorted DatetimeIndex
+    """
+    day_slices = get_day_slices(index)
+    return np.repeat(
+        np.array([day for day, _, _ in day_slices], dtype=object),
+        [stop - start for _, start, stop in day_slices]
+    )
+
+
 def to_epochs(time):
     return int(math.floor(time.value / 1e9))
 
 
+def index_to_epochs_ns(index):
+    """
+    Get the int64 epochs (in nanoseconds, UTC) of a DatetimeIndex
+    """
+    return index.values.astype("datetime64[ns]").view(np.int64)
+
+
 def is_earlier(ts1, ts2):
     """
     check if timestamp 'ts1' is earlier/older than timestamp 'ts2'
@@ -269,6 +467,162 @@ def energy2power(energy_df):
     return power_df
 
 
+def get_energy_segments(epochs, valid, gap):
+    """
+    Split the rows of a cumulative energy matrix in segments separated by holes
+    - epochs : timestamps of the rows (int64 ns)
+    - valid : True if the row has no nan value
+    - gap : hole threshold (ns)
+    A hole = more than 'gap' between 2 consecutive valid rows : the rows inside a hole
+    are dropped. The first segment starts at the first row if its first valid row
+    is at most 'gap' after it (same for the end of the last segment).
+    If there is no hole, 1 segment with all the rows.
+    return 2 arrays : position of the first row, and position after the last row
+    of each segment
+    """
+    n = len(epochs)
+    valid_pos = np.flatnonzero(valid)
+    holes = np.flatnonzero(np.diff(epochs[valid_pos]) > gap)
+    if len(holes) == 0:
+        return np.array([0]), np.array([n])
+
+    starts = valid_pos[np.r_[0, holes + 1]]
+    ends = valid_pos[np.r_[holes, len(valid_pos) - 1]] + 1
+    if starts[0] != 0 and epochs[starts[0]] - epochs[0] <= gap:
+        starts[0] = 0
+    if ends[-1] != n and epochs[n - 1] - epochs[ends[-1] - 1] <= gap:
+        ends[-1] = n
+    return starts, ends
+
+
+def segments_energy2power_numpy(energy, epochs, starts, ends):
+    """
+    NumPy kernel of 'segments_energy2power'
+    return the power matrix of the rows of the segments (concatenated)
+    """
+    lengths = ends - starts
+    firsts = np.cumsum(lengths) - lengths  # first row of each segment in the output
+    rows = np.arange(lengths.sum()) + np.repeat(starts - firsts, lengths)
+    filled = energy[rows]
+    epochs = epochs[rows]
+    nb_rows = len(rows)
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+
+    # ffill then bfill in the segment : only the missing values are looked up
+    for col in range(filled.shape[1]):
+        missing = np.isnan(filled[:, col])
+        missing_rows = np.flatnonzero(missing)
+        valid_rows = np.flatnonzero(~missing)
+        if len(missing_rows) == 0 or len(valid_rows) == 0:
+            continue
+        i = np.searchsorted(valid_rows, missing_rows)
+        prev_rows = valid_rows[np.maximum(i - 1, 0)]
+        next_rows = valid_rows[np.minimum(i, len(valid_rows) - 1)]
+        seg = segments[missing_rows]
+        filled[missing_rows, col] = np.where(
+            (i > 0) & (segments[prev_rows] == seg),
+            filled[prev_rows, col],
+            np.where(
+                (i < len(valid_rows)) & (segments[next_rows] == seg),
+                filled[next_rows, col],
+                np.nan
+            )
+        )
+
+    # diff in the segment, the first row of a segment takes the value of the second
+    diff = np.empty_like(filled)
+    diff[1:] = filled[1:] - filled[:-1]
+    delta = np.empty(nb_rows)
+    delta[1:] = np.diff(epochs) / 1e9
+    long_segments = firsts[lengths > 1]
+    diff[long_segments] = diff[long_segments + 1]
+    delta[long_segments] = delta[long_segments + 1]
+    # 1 row segment : nan power
+    delta[firsts[lengths == 1]] = np.nan
+
+    return np.where(np.isnan(diff), 0., diff) * 3600 / delta[:, np.newaxis]
+
+
+def segments_energy2power_loops(energy, epochs, starts, ends):
+    """
+    Loop kernel of 'segments_energy2power' : 1 pass over the rows of each segment
+    and each column. Compiled by numba if installed.
+    return the power matrix of the rows of the segments (concatenated)
+    """
+    nb_cols = energy.shape[1]
+    power = np.empty(((ends - starts).sum(), nb_cols))
+    first = 0  # first row of the segment in the output
+    for seg in range(len(starts)):
+        start = starts[seg]
+        length = ends[seg] - start
+        for col in range(nb_cols):
+            # bfill before the first valid value, ffill after
+            filled = np.nan
+            for i in range(length):
+                if not np.isnan(energy[start + i, col]):
+                    filled = energy[start + i, col]
+                    break
+            previous = np.nan
+            for i in range(length):
+                if not np.isnan(energy[start + i, col]):
+                    filled = energy[start + i, col]
+                if i > 0:
+                    diff = filled - previous
+                    if np.isnan(diff):
+                        diff = 0.
+                    delta = (epochs[start + i] - epochs[start + i - 1]) / 1e9
+                    power[first + i, col] = diff * 3600 / delta
+                previous = filled
+            # the first row takes the value of the second one, nan if only 1 row
+            if length > 1:
+                power[first, col] = power[first + 1, col]
+            elif length == 1:
+                power[first, col] = np.nan
+        first += length
+
+    return power
+
+
+if numba is not None:
+    segments_energy2power_loops = numba.njit(cache=True)(segments_energy2power_loops)
+
+
+def get_energy2power_kernel(engine):
+    """
+    Get the kernel of 'segments_energy2power' given the engine (see ENERGY2POWER_ENGINE)
+    """
+    if engine == "auto":
+        engine = "numba" if numba is not None else "numpy"
+    if engine == "numba":
+        if numba is not None:
+            return segments_energy2power_loops
+        logging.warning("numba is not installed : energy2power uses the NumPy kernel")
+    return segments_energy2power_numpy
+
+
+ENERGY2POWER_KERNEL = get_energy2power_kernel(ENERGY2POWER_ENGINE)
+
+
+def segments_energy2power(energy, epochs, starts, ends):
+    """
+    Same as 'energy2power' applied on each segment of rows [start, end) of a
+    cumulative energy matrix, computed in 1 pass for all the segments.
+    - energy : matrix (1 row per timestamp, 1 column per sensor)
+    - epochs : timestamps of the rows (int64 ns)
+    return the power matrix of the rows of the segments (concatenated),
+    the positions of these rows
+    """
+    lengths = ends - starts
+    rows = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    power = ENERGY2POWER_KERNEL(
+        np.ascontiguousarray(energy, dtype=np.float64),
+        np.ascontiguousarray(epochs, dtype=np.int64),
+        starts.astype(np.int64),
+        ends.astype(np.int64)
+    )
+    return power, rows
+
+
 def get_time_spent(time_begin, time_end):
     """
     Get the time spent in seconds between 2 timings (1 timing = time.time())
@@ -291,8 +645,9 @@ def get_local_timestamps_index(df):
 
 
 def main():
-    config = get_last_registered_config()
-    print(config.get_sensors_config())
+    with ptc.cassandra_session():
+        config = get_last_registered_config()
+        print(config.get_sensors_config())
 
 
 if __name__ == '__main__':
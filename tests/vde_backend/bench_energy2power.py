@@ -0,0 +1,70 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call the benchmark from the top-level folder, like:
+# python3 tests/vde_backend/bench_energy2power.py
+
+"""
+Micro-benchmark of the conversion from cumulative energy to power on realistic
+Flukso series : 1 day of 8-second samples, 3 sensors, a few missing values.
+Compares 'energy2power' (pandas) with the NumPy and the numba kernels of
+'segments_energy2power'.
+"""
+
+import constants
+import numpy as np
+import os.path
+import pandas as pd
+import timeit
+
+logdir = os.path.dirname(constants.LOG_FILE)
+if os.path.exists(logdir):
+    import utils
+else:
+    raise FileNotFoundError('Please create {} before running the benchmark.'.format(logdir))
+
+
+NB_SENSORS = 3
+NB_REPEATS = 20
+
+
+def get_energy_df():
+    """
+    1 day of cumulative energy, sampled every 8 seconds, with 1 % of missing values
+    """
+    rng = np.random.default_rng(0)
+    index = pd.date_range('2022-09-11', periods=24 * 3600 // 8, freq='8s', tz='CET')
+    energy = np.cumsum(rng.random((len(index), NB_SENSORS)) * 0.01, axis=0)
+    energy[rng.random(energy.shape) < 0.01] = np.nan
+    return pd.DataFrame(energy, index=index)
+
+
+def bench(name, func):
+    func()  # warm up (numba compilation)
+    best = min(timeit.repeat(func, number=1, repeat=NB_REPEATS))
+    print("{:<24} {:>10.3f} ms".format(name, best * 1000))
+
+
+def main():
+    energy_df = get_energy_df()
+    energy = energy_df.values
+    epochs = utils.index_to_epochs_ns(energy_df.index)
+    starts = np.array([0])
+    ends = np.array([len(energy)])
+    print("{} rows x {} sensors, best of {} runs".format(len(energy), NB_SENSORS, NB_REPEATS))
+
+    bench("energy2power (pandas)", lambda: utils.energy2power(energy_df))
+    bench(
+        "numpy kernel",
+        lambda: utils.segments_energy2power_numpy(energy, epochs, starts, ends)
+    )
+    if utils.numba is not None:
+        bench(
+            "numba kernel",
+            lambda: utils.segments_energy2power_loops(energy, epochs, starts, ends)
+        )
+    else:
+        print("numba kernel             numba is not installed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call tests from the top-level folder, like:
+# python3 tests/vde_backend/test_compute_power.py
+
+import constants
+import numpy as np
+import os.path
+import pandas as pd
+import unittest
+
+logdir = os.path.dirname(constants.LOG_FILE)
+if os.path.exists(logdir):
+    import compute_power
+    from home_series import HomeSeries
+else:
+    raise FileNotFoundError('Please create {} before running the tests.'.format(logdir))
+
+
+class TestConsumptionProduction(unittest.TestCase):
+    def setUp(self):
+        self.home_config = pd.DataFrame({
+            'home_id': ['h1', 'h1', 'h1'],
+            'net': [1., 1., 0.],
+            'pro': [0., -1., 0.],
+        }, index=['s1', 's2', 's3'])
+        index = pd.date_range('2022-09-11 10:00', periods=3, freq='8s', tz='CET')
+        self.raw_df = pd.DataFrame({
+            's2': [-500., np.nan, -300.],
+            's1': [1000., 1200., np.nan],
+            's3': [np.nan, 50., 60.],
+        }, index=index)
+
+    def test_live(self):
+        cons_prod_df = compute_power.get_consumption_production_df(self.raw_df, self.home_config)
+        np.testing.assert_array_equal(
+            np.array([
+                # missing s3 (net == 0) : 0 ; missing s1, s2 (net != 0) : P_tot is missing
+                [0., 500., 500.],
+                [np.nan, 0., np.nan],
+                [np.nan, 300., np.nan],
+            ]),
+            cons_prod_df[['P_cons', 'P_prod', 'P_tot']].values
+        )
+
+    def test_live_sensor_net_and_pro(self):
+        # s2 has a net and a pro coefficient : it was given twice by the live sync
+        columns = ['s1', 's2', 's2', 's3']
+        raw = HomeSeries(
+            self.raw_df.index.values.astype('datetime64[ns]').view(np.int64),
+            self.raw_df[columns].values.astype(np.float32),
+            columns
+        )
+        cons_prod = compute_power.get_consumption_production_series(raw, self.home_config)
+        np.testing.assert_array_equal(
+            compute_power.get_consumption_production_df(
+                self.raw_df, self.home_config
+            ).values.astype(np.float32),
+            cons_prod.values
+        )
+
+    def test_recompute_same_as_live(self):
+        # the raw table rows : 1 row per sensor and timestamp
+        home_raw_data = (
+            self.raw_df
+            .stack()
+            .rename('power')
+            .rename_axis(['ts', 'sensor_id'])
+            .reset_index()
+            .assign(day='2022-09-11')
+            [['sensor_id', 'day', 'ts', 'power']]
+        )
+        cons_prod_df = compute_power.get_home_consumption_production_df(
+            home_raw_data, self.home_config
+        )
+        self.assertEqual(
+            ['home_id', 'day', 'ts', 'P_cons', 'P_prod', 'P_tot'],
+            list(cons_prod_df.columns)
+        )
+        np.testing.assert_array_equal(
+            compute_power.get_consumption_production_df(self.raw_df, self.home_config).values,
+            cons_prod_df[['P_cons', 'P_prod', 'P_tot']].values
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call tests from the top-level folder, like:
+# python3 tests/vde_backend/test_home_series.py
+
+import numpy as np
+import pandas as pd
+import unittest
+
+from home_series import HomeSeries
+
+
+class TestHomeSeries(unittest.TestCase):
+    def test_from_arrays(self):
+        index = pd.date_range('2022-09-11 10:00', periods=3, freq='8s', tz='CET')
+        epochs = index.values.astype('datetime64[ns]').view(np.int64)
+        series = HomeSeries.from_arrays(
+            [(epochs[:2], np.array([1., 2.])), (epochs[2:], np.array([3.]))],
+            ['s1', 's2']
+        )
+        np.testing.assert_array_equal(
+            np.array([[1., np.nan], [2., np.nan], [np.nan, 3.]]), series.values
+        )
+        self.assertTrue((index == series.get_index()).all())
+
+    def test_concat_columns(self):
+        s1 = HomeSeries(np.array([0, 8]), np.array([[1.], [2.]], dtype=np.float32), ['s1'])
+        s2 = HomeSeries(np.array([8, 16]), np.array([[3.], [4.]], dtype=np.float32), ['s2'])
+        series = HomeSeries.concat_columns([s1, s2])
+        np.testing.assert_array_equal(np.array([0, 8, 16]), series.epochs)
+        np.testing.assert_array_equal(
+            np.array([[1., np.nan], [2., 3.], [np.nan, 4.]], dtype=np.float32), series.values
+        )
+        self.assertEqual(np.float32, series.values.dtype)
+        self.assertEqual(['s2'], series.select(['s2']).columns)
+
+    def test_slice(self):
+        series = HomeSeries(np.array([0, 8, 16]), np.array([[1.], [2.], [3.]]), ['s1'])
+        rows = series.slice(1, 3)
+        np.testing.assert_array_equal(np.array([8, 16]), rows.epochs)
+        np.testing.assert_array_equal(np.array([[2.], [3.]]), rows.values)
+        self.assertEqual(['s1'], rows.columns)
+
+
+if __name__ == '__main__':
+    unittest.main()
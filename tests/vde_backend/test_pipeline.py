@@ -0,0 +1,62 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call tests from the top-level folder, like:
+# python3 tests/vde_backend/test_pipeline.py
+
+import threading
+import unittest
+import unittest.mock
+
+from pipeline import Pipeline, Stage
+
+
+class StopWorker(BaseException):
+    pass
+
+
+class TestPipeline(unittest.TestCase):
+    def test_items_through_stages(self):
+        written = []
+        closed = []
+        stages = [
+            Stage("double", lambda state, x: 2 * x, 2, init=list, close=closed.append),
+            Stage("split", lambda x: [x, x + 1], 3, expand=True),
+            Stage("write", written.append),
+        ]
+        stats = Pipeline(stages, 2).run(range(10))
+
+        expected = [y for x in range(10) for y in [2 * x, 2 * x + 1]]
+        self.assertEqual(sorted(expected), sorted(written))
+        self.assertEqual(2, len(closed))
+        self.assertEqual(10, stats["double"]["items"])
+        self.assertEqual(20, stats["write"]["items"])
+        self.assertLessEqual(stats["write"]["max_depth"], 2)
+
+    def test_failed_items_are_dropped(self):
+        written = []
+
+        def check(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+
+        stats = Pipeline([Stage("check", check), Stage("write", written.append)], 1).run(range(5))
+        self.assertEqual([0, 1, 2, 4], written)
+        self.assertEqual(1, stats["check"]["errors"])
+
+    def test_stopped_stage_does_not_block(self):
+        # the thread of the stage 'stop' ends at the first item
+        def stop(x):
+            raise StopWorker(x)
+
+        with unittest.mock.patch.object(threading, "excepthook") as excepthook:
+            stats = Pipeline(
+                [Stage("read", lambda x: x), Stage("stop", stop)], 1
+            ).run(range(20))
+        self.assertEqual(20, stats["read"]["items"])
+        self.assertEqual(0, stats["stop"]["items"])
+        excepthook.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call tests from the top-level folder, like:
+# python3 tests/vde_backend/test_py_to_cassandra.py
+
+import constants
+import datetime
+import numpy as np
+import os.path
+import pandas as pd
+import unittest
+import unittest.mock
+
+logdir = os.path.dirname(constants.LOG_FILE)
+if os.path.exists(logdir):
+    import py_to_cassandra as ptc
+else:
+    raise FileNotFoundError('Please create {} before running the tests.'.format(logdir))
+
+
+class FakeBatch(list):
+    """
+    Batch statement keeping the bound rows, to inspect the batches
+    """
+    def __init__(self, batch_type=None):
+        super().__init__()
+
+    def add(self, statement, parameters=None):
+        self.append(parameters)
+
+
+class TestInsertBatches(unittest.TestCase):
+    def setUp(self):
+        patcher = unittest.mock.patch('cassandra.query.BatchStatement', FakeBatch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.prepared = unittest.mock.Mock(column_metadata=[None] * 3)
+
+    def test_group_by_partition_key(self):
+        rows = [
+            ('s1', '2022-09-11', 1.0),
+            ('s2', '2022-09-11', 2.0),
+            ('s1', '2022-09-12', 3.0),
+            ('s1', '2022-09-11', 4.0),
+        ]
+        batches = list(ptc.get_insert_batches(self.prepared, rows, (0, 1)))
+        self.assertEqual(
+            [
+                [('s1', '2022-09-11', 1.0), ('s1', '2022-09-11', 4.0)],
+                [('s2', '2022-09-11', 2.0)],
+                [('s1', '2022-09-12', 3.0)],
+            ],
+            batches
+        )
+
+    def test_split_by_size(self):
+        rows = [('s1', '2022-09-11', float(i)) for i in range(10)]
+        # 1 row = 32 bytes of overhead + 2 + 10 + 8 bytes of values = 52 bytes
+        batches = list(ptc.get_insert_batches(self.prepared, rows, (0,), max_bytes=160))
+        self.assertEqual([4, 4, 2], [len(b) for b in batches])
+
+
+class TestPandasFactory(unittest.TestCase):
+    def test_typed_columns(self):
+        rows = [
+            ('s1', '2022-09-11', datetime.datetime(2022, 9, 11, 10, 0), 1.5),
+            ('s1', '2022-09-11', datetime.datetime(2022, 9, 11, 10, 0, 8), None),
+        ]
+        df = ptc.pandas_factory(['sensor_id', 'day', 'ts', 'power'], rows)
+        self.assertEqual(np.float32, df['power'].dtype)
+        self.assertTrue(np.isnan(df['power'][1]))
+
+        ptc.convert_columns_timezones(df, 'CET')
+        self.assertEqual(pd.Timestamp('2022-09-11T12:00:00', tz='CET'), df['ts'][0])
+
+
+class TestConcatChunks(unittest.TestCase):
+    def test_concat(self):
+        chunks = [
+            pd.DataFrame({'sensor_id': ['s1', 's2'], 'power': [1.0, 2.0]}),
+            pd.DataFrame({'sensor_id': [], 'power': []}),
+            pd.DataFrame({'sensor_id': ['s3'], 'power': [3.0]}),
+        ]
+        df = ptc.concat_chunks(iter(chunks))
+        self.assertEqual(['s1', 's2', 's3'], list(df['sensor_id']))
+        self.assertEqual([0, 1, 2], list(df.index))
+
+    def test_empty_result_keeps_columns(self):
+        df = ptc.concat_chunks(iter([pd.DataFrame(columns=['sensor_id', 'power'])]))
+        self.assertEqual(0, len(df))
+        self.assertEqual(['sensor_id', 'power'], list(df.columns))
+
+    def test_memory_limit(self):
+        chunks = (pd.DataFrame({'power': [1.0] * 100}) for _ in range(10))
+        self.assertRaises(MemoryError, ptc.concat_chunks, chunks, 2000)
+
+
+class TestSelectRange(unittest.TestCase):
+    def test_results_by_date(self):
+        def execute_async(statement, **kwargs):
+            # the result of a query : its sensor id and day
+            sid, day = [part.split("'")[1] for part in statement.query_string.split(' and ')]
+            rslt = unittest.mock.Mock(has_more_pages=False)
+            rslt._current_rows = pd.DataFrame({'sensor_id': [sid], 'day': [day]})
+            return unittest.mock.Mock(**{'result.return_value': rslt})
+
+        with unittest.mock.patch.object(ptc, 'SESSION') as session:
+            session.execute_async.side_effect = execute_async
+            by_date = ptc.select_range(
+                'test', 'raw', ['sensor_id', 'day'], 'sensor_id',
+                ['s1', 's2', 's3'], ['2022-09-11', '2022-09-12']
+            )
+
+        self.assertEqual(['2022-09-11', '2022-09-12'], list(by_date.keys()))
+        for date, date_df in by_date.items():
+            self.assertEqual(['s1', 's2', 's3'], list(date_df['sensor_id']))
+            self.assertEqual([date] * 3, list(date_df['day']))
+
+
+class TestAsyncWriter(unittest.TestCase):
+    def test_collect_errors(self):
+        futures = []
+
+        def execute_async(statement, **kwargs):
+            future = unittest.mock.Mock()
+            futures.append((statement, future))
+            return future
+
+        with unittest.mock.patch.object(ptc, 'SESSION') as session:
+            session.execute_async.side_effect = execute_async
+            writer = ptc.AsyncWriter(concurrency=2)
+            writer.execute('q1', 'raw')
+            writer.execute('q2', 'power')
+            self.assertEqual(2, writer.in_flight)
+
+            # complete the requests as the driver would : through the callbacks
+            for statement, future in futures:
+                kwargs = future.add_callbacks.call_args[1]
+                if statement == 'q1':
+                    kwargs['callback']([])
+                else:
+                    kwargs['errback'](ValueError('timeout'), *kwargs['errback_args'])
+
+            errors = writer.flush()
+
+        self.assertEqual(0, writer.in_flight)
+        self.assertEqual(1, len(errors))
+        self.assertEqual('power', errors[0][0])
+
+
+class TestWriteGroup(unittest.TestCase):
+    def setUp(self):
+        self.writer = ptc.AsyncWriter()
+        self.groups = [ptc.WriteGroup(self.writer), ptc.WriteGroup(self.writer)]
+        for patcher in [
+            unittest.mock.patch.object(ptc, 'prepare_insert'),
+            unittest.mock.patch.object(ptc, 'get_insert_batches', return_value=['batch']),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_failed_request_counted_in_its_group(self):
+        with unittest.mock.patch.object(ptc, 'SESSION') as session:
+            session.execute_async.side_effect = ValueError('timeout')
+            self.groups[0].insert('test', 'raw', ['sensor_id'], [('s1',)])
+
+        self.assertEqual([1, 0], [group.nb_errors for group in self.groups])
+        self.assertEqual(1, len(self.writer.flush()))
+        self.assertFalse(self.groups[0].send_deferred())
+
+    def test_insert_error_counted_in_its_group(self):
+        ptc.prepare_insert.side_effect = ValueError('no table')
+        with self.assertRaises(ValueError):
+            self.groups[1].insert('test', 'raw', ['sensor_id'], [('s1',)])
+
+        self.assertEqual([0, 1], [group.nb_errors for group in self.groups])
+        self.assertEqual('raw', self.writer.flush()[0][0])
+        self.assertFalse(self.groups[1].send_deferred())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call tests from the top-level folder, like:
+# python3 tests/vde_backend/test_raw_missing.py
+
+import constants
+import os.path
+import pandas as pd
+import unittest
+import unittest.mock
+
+logdir = os.path.dirname(constants.LOG_FILE)
+if os.path.exists(logdir):
+    import raw_missing
+else:
+    raise FileNotFoundError('Please create {} before running the tests.'.format(logdir))
+
+
+def ts(time):
+    return pd.Timestamp('2022-09-11 ' + time, tz='CET')
+
+
+class TestRawMissing(unittest.TestCase):
+    def setUp(self):
+        self.config_id = pd.Timestamp('2022-09-01', tz='CET')
+        self.store = raw_missing.RawMissing({
+            's1': [(self.config_id, ts('10:00'), ts('11:00'))],
+            's2': [
+                (self.config_id, ts('08:00'), ts('09:00')),
+                (self.config_id, ts('10:00'), ts('11:00')),
+            ],
+        })
+        self.writer = unittest.mock.Mock()
+
+    def get_written_rows(self, method):
+        return getattr(self.writer, method).call_args[0][3]
+
+    def test_close_and_open_gaps(self):
+        # s1 and s2 synced from 09:30 to 12:00 : s1 has a new gap, s2 has none
+        new_gaps = {'s1': [(ts('11:30'), ts('12:10'))]}
+        self.store.update(
+            ['s1', 's2'], self.config_id, ts('09:30'), ts('12:00'), new_gaps, self.writer
+        )
+
+        self.assertEqual(ts('11:30'), self.store.get_first_start('s1'))
+        self.assertEqual(
+            [(self.config_id, ts('08:00'), ts('09:00'))],
+            self.store.get_sensor_gaps('s2')
+        )
+        self.assertEqual(
+            [('s1', self.config_id, ts('10:00')), ('s2', self.config_id, ts('10:00'))],
+            self.get_written_rows('delete')
+        )
+        self.assertEqual(
+            [('s1', self.config_id, ts('11:30'), ts('12:10'))],
+            self.get_written_rows('insert')
+        )
+
+    def test_merge_gaps(self):
+        # the first gap of s2 is only partially synced : its remaining part is merged
+        # with the new gap, starting at the beginning of the sync
+        new_gaps = {'s2': [(ts('08:30'), ts('09:15'))]}
+        self.store.update(['s2'], self.config_id, ts('08:30'), ts('09:30'), new_gaps, self.writer)
+
+        self.assertEqual(
+            [
+                (self.config_id, ts('08:00'), ts('09:15')),
+                (self.config_id, ts('10:00'), ts('11:00')),
+            ],
+            self.store.get_sensor_gaps('s2')
+        )
+        self.assertEqual([], self.get_written_rows('delete'))
+        self.assertEqual(
+            [('s2', self.config_id, ts('08:00'), ts('09:15'))],
+            self.get_written_rows('insert')
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call tests from the top-level folder, like:
+# python3 tests/vde_backend/test_sensors_config.py
+
+import numpy as np
+import pandas as pd
+import unittest
+
+from sensors_config import Configuration
+
+
+class TestConfiguration(unittest.TestCase):
+    def setUp(self):
+        sconfig_df = pd.DataFrame({
+            'home_id': ['h2', 'h1', 'h2'],
+            'flukso_id': ['f2', 'f1', 'f2'],
+            'sensor_token': ['t1', 't2', 't3'],
+            'net': [1, 1, 0],
+            'con': [1, 0, 0],
+            'pro': [0, -1, 0],
+        }, index=['s1', 's2', 's3'])
+        self.config = Configuration(pd.Timestamp('2022-09-01', tz='CET'), sconfig_df)
+
+    def test_homes(self):
+        self.assertEqual(['h1', 'h2'], self.config.get_home_ids())
+        home = self.config.get_home('h2')
+        self.assertEqual(['s1', 's3'], home.sensors_ids)
+        self.assertEqual(['t1', 't3'], home.tokens)
+        np.testing.assert_array_equal(np.array([1., 0.]), home.net)
+        self.assertEqual(['s1', 's3'], list(self.config.get_home_config('h2').index))
+
+    def test_home_sensors_copy(self):
+        home_sensors = self.config.get_home_sensors()
+        home_sensors['h2'].append('s4')
+        del home_sensors['h1']
+        self.assertEqual({'h1': ['s2'], 'h2': ['s1', 's3']}, self.config.get_ids())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call tests from the top-level folder, like:
+# python3 tests/vde_backend/test_sync_flukso.py
+
+import constants
+import numpy as np
+import os.path
+import pandas as pd
+import unittest
+import unittest.mock
+
+logdir = os.path.dirname(constants.LOG_FILE)
+if os.path.exists(logdir):
+    import py_to_cassandra as ptc
+    import sync_flukso
+    import utils
+    from home_series import HomeSeries
+    from sensors_config import Configuration
+else:
+    raise FileNotFoundError('Please create {} before running the tests.'.format(logdir))
+
+
+class TestMissingIntervals(unittest.TestCase):
+    def test_intervals(self):
+        index = pd.date_range('2022-09-11 10:00', periods=6, freq='8s', tz='CET')
+        to_timing = pd.Timestamp('2022-09-11 11:00', tz='CET')
+        missing = np.array([
+            [True, False],
+            [True, False],
+            [False, False],
+            [True, False],
+            [False, True],
+            [False, True],
+        ])
+        intervals = sync_flukso.get_missing_intervals(missing, index, ['s1', 's2'], to_timing)
+        self.assertEqual(
+            {
+                's1': [(index[0], index[2]), (index[3], index[4])],
+                's2': [(index[4], to_timing)],
+            },
+            intervals
+        )
+
+
+class TestGenerateRawDf(unittest.TestCase):
+    def test_same_as_energy2power_per_segment(self):
+        index = pd.DatetimeIndex([
+            '2022-09-11 00:00', '2022-09-11 01:00', '2022-09-11 02:00', '2022-09-11 03:00',
+            # hole > GAP_THRESHOLD (4h) between 03:00 and 12:00
+            '2022-09-11 09:00', '2022-09-11 12:00', '2022-09-11 13:00', '2022-09-11 14:00',
+            '2022-09-11 15:00',
+        ], tz='UTC')
+        energy_df = pd.DataFrame({
+            's1': [np.nan, 1., 2., 4., np.nan, 10., 11., np.nan, 15.],
+            's2': [np.nan, 5., np.nan, 6., 7., 8., 9., 9., np.nan],
+        }, index=index)
+
+        energy = HomeSeries(
+            utils.index_to_epochs_ns(energy_df.index), energy_df.values, list(energy_df.columns)
+        )
+        raw_df = sync_flukso.generate_raw_series(energy).to_frame(tz='UTC')
+        expected = pd.concat([
+            # the first segment starts at the first row (1h before its first valid row)
+            utils.energy2power(energy_df.iloc[0:4]),
+            # the last segment ends at the last row, the row inside the hole is dropped
+            utils.energy2power(energy_df.iloc[5:9]),
+        ])
+        pd.testing.assert_frame_equal(expected, raw_df, check_index_type=False)
+
+
+class TestCreateRawSeries(unittest.TestCase):
+    def test_one_column_per_sensor(self):
+        sconfig_df = pd.DataFrame({
+            'home_id': ['h1'] * 4,
+            'flukso_id': ['f1'] * 4,
+            'sensor_token': ['t1', 't2', 't3', 't4'],
+            'net': [0, 1, 1, 0],
+            'con': [0, 1, 0, 0],
+            'pro': [1, 0, -1, 0],
+        }, index=['s3', 's1', 's2', 's4'])
+        home = Configuration(pd.Timestamp('2022-09-01', tz='CET'), sconfig_df).get_home('h1')
+        index = pd.date_range('2022-09-11 10:00', periods=4, freq='8s', tz='UTC')
+        energy = HomeSeries(
+            utils.index_to_epochs_ns(index),
+            np.cumsum(np.ones((4, 4)), axis=0),
+            ['s3', 's1', 's2', 's4']
+        )
+        raw = sync_flukso.create_flukso_raw_series(energy, home)
+        # s2 (net and pro) once, s4 (no coefficient) not kept, in the order of the config
+        self.assertEqual(['s3', 's1', 's2'], raw.columns)
+        self.assertEqual((3, 3), raw.values.shape)
+
+
+class FakeWriter:
+    def __init__(self, errors):
+        self.errors = errors  # errors returned by the successive flushes
+        self.tables = []
+        self.rows = []
+
+    def insert(self, keyspace, table, columns, rows, partition_by=None, group=None):
+        self.tables.append(table)
+        self.rows += rows
+
+    def flush(self):
+        return self.errors.pop(0)
+
+
+class TestFlushWrites(unittest.TestCase):
+    def get_group(self, writer, sid):
+        group = ptc.WriteGroup(writer)
+        group.deferred.insert('test', 'raw_last_ts', ['sensor_id', 'last_ts'], [(sid, 0)])
+        return group
+
+    def test_deferred_written_after_rows(self):
+        writer = FakeWriter([[], []])
+        groups = [self.get_group(writer, 's1')]
+        self.assertEqual([], sync_flukso.flush_writes(writer, groups))
+        self.assertEqual(['raw_last_ts'], writer.tables)
+
+    def test_deferred_not_written_if_rows_failed(self):
+        writer = FakeWriter([[('raw', ValueError('timeout'))], []])
+        groups = [self.get_group(writer, 's1'), self.get_group(writer, 's2')]
+        # the failed request is a row of the 1st home : only the 2nd one is up to date
+        groups[0].fail()
+        self.assertEqual(1, len(sync_flukso.flush_writes(writer, groups)))
+        self.assertEqual([('s2', 0)], writer.rows)
+
+
+class FailingWriter(FakeWriter):
+    """
+    The inserts in the raw table raise
+    """
+    def insert(self, keyspace, table, columns, rows, partition_by=None, group=None):
+        if table == 'raw':
+            raise ValueError('prepare failed')
+        super().insert(keyspace, table, columns, rows, partition_by)
+
+    def add_error(self, description, exception, group=None):
+        group.fail()
+
+
+class StopWorker(BaseException):
+    pass
+
+
+class TestPipelineWrites(unittest.TestCase):
+    def setUp(self):
+        # 1 home, 3 days : 1 raw row per day, and its last timestamp deferred
+        def serialize_home_span(span, *args):
+            group = span['group']
+            for day in range(3):
+                pending = group.new_pending()
+                pending.insert('test', 'raw', ['sensor_id', 'ts'], [('s1', day)])
+                group.deferred.insert(
+                    'test', 'raw_last_ts', ['sensor_id', 'last_ts'], [('s1', day)]
+                )
+                yield group, pending
+
+        for patcher in [
+            unittest.mock.patch.object(sync_flukso, 'TmpoReader'),
+            unittest.mock.patch.object(
+                sync_flukso, 'fetch_home_span', lambda reader, home, *args: {'stats': {}}
+            ),
+            unittest.mock.patch.object(sync_flukso, 'compute_home_span', lambda span: span),
+            unittest.mock.patch.object(sync_flukso, 'serialize_home_span', serialize_home_span),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sync(self, writer):
+        _, groups = sync_flukso.process_homes_pipeline(
+            [('h1', None)], unittest.mock.Mock(), None, None, None, None, False, None,
+            {'fetch': 1, 'compute': 1, 'serialize': 1, 'write': 1}, writer
+        )
+        return sync_flukso.flush_writes(writer, groups)
+
+    def test_deferred_written_after_days(self):
+        writer = FakeWriter([[], []])
+        self.sync(writer)
+        self.assertEqual(['raw'] * 3 + ['raw_last_ts'] * 3, writer.tables)
+
+    def test_deferred_not_written_if_write_failed(self):
+        writer = FailingWriter([[], []])
+        self.sync(writer)
+        self.assertEqual([], writer.tables)
+
+    def test_deferred_not_written_if_write_stopped(self):
+        # the write worker stops after the 1st day : the other days are drained
+        send = ptc.WriteGroup.send
+
+        def send_once(group, pending):
+            if len(writer.tables) > 0:
+                raise StopWorker()
+            send(group, pending)
+
+        writer = FakeWriter([[], []])
+        with unittest.mock.patch.object(ptc.WriteGroup, 'send', send_once):
+            self.sync(writer)
+        self.assertEqual(['raw'], writer.tables)
+
+
+class TestSyncHomeWorker(unittest.TestCase):
+    def test_deferred_not_written_if_sync_failed(self):
+        def process_home_span(tmpo_reader, hid, home_sensors, *args):
+            group = args[-1]
+            group.deferred.insert('test', 'raw_last_ts', ['sensor_id', 'last_ts'], [('s1', 0)])
+            raise ValueError('send failed')
+
+        writer = FakeWriter([[], []])
+        worker = {'span': True, 'tmpo_reader': None, 'writer': writer, 'args': ()}
+        with unittest.mock.patch.dict(sync_flukso.WORKER, worker), \
+                unittest.mock.patch.object(sync_flukso, 'process_home_span', process_home_span):
+            sync_flukso.sync_home_worker(('h1', None))
+
+        self.assertEqual([], writer.tables)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call tests from the top-level folder, like:
+# python3 tests/vde_backend/test_tmpo_reader.py
+
+import constants
+import gzip
+import json
+import numpy as np
+import os.path
+import pandas as pd
+import sqlite3
+import tempfile
+import unittest
+
+logdir = os.path.dirname(constants.LOG_FILE)
+if os.path.exists(logdir):
+    import tmpo
+    from tmpo_reader import TmpoReader
+else:
+    raise FileNotFoundError('Please create {} before running the tests.'.format(logdir))
+
+
+def encode_block(epochs, values):
+    """
+    tmpo block : timestamps and values as deltas from the head
+    """
+    block = {
+        'h': {'head': [epochs[0], values[0]], 'tail': [epochs[-1], values[-1]]},
+        't': [0] + list(np.diff(epochs)),
+        'v': [0] + list(np.diff(values)),
+    }
+    return gzip.compress(json.dumps(block, default=int, separators=(',', ':')).encode())
+
+
+class TestTmpoReader(unittest.TestCase):
+    def setUp(self):
+        self.tmpo_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpo_dir.cleanup)
+        self.db = os.path.join(self.tmpo_dir.name, 'tmpo.sqlite3')
+        # 1 block of level 12 (4096 s), followed by 1 block of level 8 (256 s)
+        # and 1 old block of a previous recycle id
+        blocks = [
+            (1, 12, 4096, list(range(4096, 8192, 512)), [10, 12, 15, 15, 20, 21, 21, 30]),
+            (1, 8, 8192, [8192, 8200], [31, 33]),
+            (0, 8, 4096, [4096], [999]),
+        ]
+        with sqlite3.connect(self.db) as con:
+            con.execute(tmpo.SQL_TMPO_TABLE)
+            for rid, lvl, bid, epochs, values in blocks:
+                con.execute(
+                    tmpo.SQL_TMPO_INS,
+                    ('s1', rid, lvl, bid, 'gz', 0., encode_block(epochs, values))
+                )
+        self.reader = TmpoReader(self.db)
+        self.addCleanup(self.reader.close)
+
+    def test_read_window(self):
+        epochs, values = self.reader.read(
+            's1', pd.Timestamp(5000, unit='s', tz='UTC'), pd.Timestamp(8192, unit='s', tz='UTC')
+        )
+        np.testing.assert_array_equal(
+            np.array([5120, 5632, 6144, 6656, 7168, 7680, 8192]) * 10**9, epochs
+        )
+        np.testing.assert_array_equal(np.array([15., 15., 20., 21., 21., 30., 31.]), values)
+
+    def test_blocks_decoded_once(self):
+        for start in [4096, 6000]:
+            self.reader.read('s1', pd.Timestamp(start, unit='s', tz='UTC'))
+        self.assertEqual({'hits': 2, 'misses': 2}, self.reader.stats)
+        epochs, values = self.reader.read('s2', pd.Timestamp(0, unit='s', tz='UTC'))
+        self.assertEqual(0, len(epochs))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call tests from the top-level folder, like:
+# python3 tests/vde_backend/test_tmpo_sync.py
+
+import constants
+import json
+import os.path
+import pandas as pd
+import requests
+import sqlite3
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+logdir = os.path.dirname(constants.LOG_FILE)
+if os.path.exists(logdir):
+    import tmpo
+    import tmpo_sync
+else:
+    raise FileNotFoundError('Please create {} before running the tests.'.format(logdir))
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, content=b'', delay=0.):
+        self.status_code = status_code
+        self.content = content if data is None else json.dumps(data).encode()
+        self.delay = delay  # time to receive each byte
+
+    def iter_content(self, chunk_size):
+        for i in range(len(self.content)):
+            time.sleep(self.delay)
+            yield self.content[i:i + 1]
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code), response=self)
+
+
+class FakeFlukso:
+    """
+    Sensor 's1' has 2 new blocks, the token of 's2' is refused
+    """
+    def __init__(self):
+        self.nb_requests = 0
+
+    def get(self, url, headers, verify, timeout, stream, params=None):
+        self.nb_requests += 1
+        if headers['X-Token'] != 't1':
+            return FakeResponse(403)
+        if url.endswith('/sync'):
+            return FakeResponse(200, [
+                {'rid': 0, 'lvl': 8, 'bid': 1000, 'ext': 'gz'},
+                {'rid': 0, 'lvl': 8, 'bid': 1256, 'ext': 'gz'},
+            ])
+        return FakeResponse(200, content=url.encode())
+
+
+class TestGetContent(unittest.TestCase):
+    def test_slow_response_stops_at_deadline(self):
+        http = unittest.mock.Mock()
+        http.get.return_value = FakeResponse(200, content=b'x' * 100, delay=0.01)
+        with self.assertRaises(TimeoutError):
+            tmpo_sync.get_content(http, 'url', time.monotonic() + 0.1)
+
+    def test_fast_response(self):
+        http = unittest.mock.Mock()
+        http.get.return_value = FakeResponse(200, [1, 2])
+        content = tmpo_sync.get_content(http, 'url', time.monotonic() + 10)
+        self.assertEqual([1, 2], json.loads(content))
+
+
+class TestSyncSensors(unittest.TestCase):
+    def setUp(self):
+        self.tmpo_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpo_dir.cleanup)
+        self.session = tmpo.Session(self.tmpo_dir.name)
+        self.flukso = FakeFlukso()
+        patcher = unittest.mock.patch.object(
+            tmpo_sync, 'get_http_session', return_value=self.flukso
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failing_sensor_is_quarantined(self):
+        reports = tmpo_sync.sync_sensors(self.session, [('s1', 't1'), ('s2', 't2')])
+        reports = {report['sid']: report for report in reports}
+
+        self.assertTrue(reports['s1']['ok'])
+        self.assertEqual(2, reports['s1']['blocks'])
+        # refused token : no retry
+        self.assertFalse(reports['s2']['ok'])
+        self.assertEqual(1, reports['s2']['attempts'])
+        with sqlite3.connect(self.session.db) as con:
+            self.assertEqual(
+                [('s1', 1000), ('s1', 1256)],
+                con.execute('SELECT sid, bid FROM tmpo ORDER BY bid').fetchall()
+            )
+
+        self.assertEqual(
+            tmpo_sync.Watermark(0, 8, 1256, 1000, unittest.mock.ANY),
+            tmpo_sync.get_watermarks(self.session)['s1']
+        )
+        self.assertEqual(
+            pd.Timestamp(1000, unit='s', tz='UTC'),
+            tmpo_sync.get_first_timestamp(self.session, 's1')
+        )
+
+        # 2nd run : s1 has just been synced, s2 is quarantined : no request
+        self.flukso.nb_requests = 0
+        self.assertEqual([], tmpo_sync.sync_sensors(self.session, [('s1', 't1'), ('s2', 't2')]))
+        self.assertEqual(0, self.flukso.nb_requests)
+
+        # session test : all the sensors, from their watermark
+        reports = tmpo_sync.sync_sensors(
+            self.session, [('s1', 't1'), ('s2', 't2')], use_quarantine=False,
+            use_sync_interval=False
+        )
+        self.assertEqual(['s1', 's2'], sorted(report['sid'] for report in reports))
+        self.assertEqual(4, self.flukso.nb_requests)
+        self.flukso.nb_requests = 0
+
+        # full resync : all the sensors, from their first block
+        reports = tmpo_sync.sync_sensors(
+            self.session, [('s1', 't1'), ('s2', 't2')], full_resync=True
+        )
+        self.assertEqual(['s1', 's2'], sorted(report['sid'] for report in reports))
+        self.assertEqual(4, self.flukso.nb_requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import sys
+sys.path.insert(1, 'src/vde_backend')
+# Call tests from the top-level folder, like:
+# python3 tests/vde_backend/test_utils.py
+
+import constants
+import numpy as np
+import os.path
+import pandas as pd
+import pickle
+import tempfile
+import unittest
+import unittest.mock
+
+logdir = os.path.dirname(constants.LOG_FILE)
+if os.path.exists(logdir):
+    import utils
+else:
+    raise FileNotFoundError('Please create {} before running the tests.'.format(logdir))
+
+
+class TestDaySlices(unittest.TestCase):
+    def test_empty_index(self):
+        self.assertEqual([], utils.get_day_slices(pd.DatetimeIndex([], tz='CET')))
+
+    def test_cet_days(self):
+        # 2022-03-27 is a DST day in CET : 23 hours long
+        index = pd.date_range('2022-03-26 22:00', '2022-03-28 01:00', freq='1h', tz='CET')
+        self.assertEqual(
+            [
+                ('2022-03-26', 0, 2),
+                ('2022-03-27', 2, 25),
+                ('2022-03-28', 25, 27),
+            ],
+            utils.get_day_slices(index)
+        )
+
+    def test_days(self):
+        index = pd.DatetimeIndex(['2022-09-11 23:00', '2022-09-11 23:30'], tz='UTC')
+        self.assertEqual(
+            ['2022-09-12', '2022-09-12'],
+            list(utils.get_days(index.tz_convert('CET')))
+        )
+
+
+class TestEnergy2PowerKernels(unittest.TestCase):
+    def test_same_as_energy2power(self):
+        index = pd.date_range('2022-09-11 10:00', periods=8, freq='8s', tz='CET')
+        energy_df = pd.DataFrame({
+            's1': [np.nan, 1., 2., np.nan, 4., 5., 7., np.nan],
+            's2': [np.nan, np.nan, np.nan, 1., 1.5, np.nan, np.nan, 3.],
+        }, index=index)
+        energy = energy_df.values
+        epochs = utils.index_to_epochs_ns(index)
+        # 3 segments : rows 0 to 3, row 4 alone, rows 5 to 7
+        starts = np.array([0, 4, 5])
+        ends = np.array([4, 5, 8])
+        expected = np.vstack([
+            utils.energy2power(energy_df.iloc[start:end]).values
+            for start, end in zip(starts, ends)
+        ])
+
+        for kernel in [utils.segments_energy2power_numpy, utils.segments_energy2power_loops]:
+            np.testing.assert_array_equal(expected, kernel(energy, epochs, starts, ends))
+
+
+class TestConfigCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        patcher = unittest.mock.patch.object(utils, 'CONFIG_CACHE_PATH', self.cache_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache_dir.cleanup)
+        self.config_id = pd.Timestamp('2022-09-01 10:00', tz='UTC')
+        self.config_df = pd.DataFrame({
+            'sensor_id': ['s1', 's2'],
+            'home_id': ['h1', 'h1'],
+            'flukso_id': ['f1', 'f1'],
+            'sensor_token': ['t1', 't2'],
+            'net': [1., 0.],
+            'con': [1., 0.],
+            'pro': [0., 1.],
+        })
+
+    def select_query(self, keyspace, table, columns, where_clause, **kwargs):
+        if table == constants.TBL_CURRENT_CONFIG:
+            return pd.DataFrame({'config_id': [self.config_id]})
+        return self.config_df
+
+    def test_pointer_then_cache(self):
+        patcher = unittest.mock.patch.object(
+            utils.ptc, 'select_query', side_effect=self.select_query
+        )
+        with patcher as select:
+            config = utils.get_last_registered_config()
+            self.assertEqual(2, select.call_count)
+            # 2nd run : only the pointer is read, the config comes from the cache
+            cached = utils.get_last_registered_config()
+            self.assertEqual(3, select.call_count)
+
+        self.assertEqual(self.config_id, cached.get_config_id())
+        self.assertEqual(config.get_ids(), cached.get_ids())
+        self.assertEqual(['config_1662026400000.pkl'], os.listdir(self.cache_dir.name))
+
+    def test_outdated_cache(self):
+        path = utils.get_config_cache_file(self.config_id)
+        with open(path, 'wb') as f:
+            pickle.dump({'version': 0, 'config_id': self.config_id, 'config_df': None}, f)
+        self.assertIsNone(utils.load_cached_config(self.config_id))
+
+
+if __name__ == '__main__':
+    unittest.main()